@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+from uuid import UUID
+
+from litestar.params import Parameter
+
+T = TypeVar("T")
+
+MAX_BATCH_SIZE = 1_000
+
+
+@dataclass
+class BatchResult(Generic[T]):
+    """Container for the records of a batch lookup."""
+
+    items: list[T]
+    """Records found, in the order their ids were asked for."""
+    missing: list[UUID]
+    """Ids asked for that match no record, in request order."""
+
+
+def provide_batch_ids(
+        ids: list[UUID] = Parameter(
+            query="ids",
+            min_items=1,
+            max_items=MAX_BATCH_SIZE,
+        ),
+) -> list[UUID]:
+    """Add the ids of a batch lookup, without duplicates.
+
+    Return type consumed by `Repository.get_many()`.
+
+    Parameters
+    ----------
+    ids : list[UUID]
+        Ids to look up, repeat the parameter for each one: `?ids=...&ids=...`.
+    """
+    return list(dict.fromkeys(ids))
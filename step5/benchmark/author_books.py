@@ -0,0 +1,65 @@
+"""Latency of loading an author with their books, for authors with few to very many books.
+
+``full`` loads every book with the ``selectinload`` of ``provide_author_details_repo``.
+``page`` is what ``GET /authors/with-books/{id}`` runs, the aggregate summary and one page of
+books. ``count`` is the same with ``countOnly=true``, the summary alone.
+
+Run with ``python -m step5.benchmark.author_books``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+
+from litestar.repository.filters import LimitOffset
+
+from step5.benchmark.common import measure, seed, temporary_database
+from step5.common import from_orm
+from step5.controller.author import AuthorRepository, provide_author_details_repo
+from step5.model.author import AuthorAndBooks
+from step5.model.book import BookWithOutAuthor
+
+
+async def run(sizes: list[int], page_size: int, repeat: int) -> None:
+    print(f"{'books':>8} {'mode':>6} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for size in sizes:
+        async with temporary_database() as (engine, session_maker):
+            (author_id,) = await seed(engine, authors=1, books_per_author=size)
+
+            async def full() -> None:
+                # a collection while the greenlet is building 100k objects can crash the interpreter
+                gc.disable()
+                try:
+                    async with session_maker() as session:
+                        repo = await provide_author_details_repo(session)
+                        from_orm(await repo.get(author_id), AuthorAndBooks)
+                finally:
+                    gc.enable()
+
+            async def page() -> None:
+                async with session_maker() as session:
+                    repo = AuthorRepository(session=session)
+                    await repo.get_books_summary(author_id)
+                    from_orm(await repo.list_books(author_id, LimitOffset(page_size, 0)), list[BookWithOutAuthor])
+
+            async def count() -> None:
+                async with session_maker() as session:
+                    await AuthorRepository(session=session).get_books_summary(author_id)
+
+            for mode, fn in (("full", full), ("page", page), ("count", count)):
+                result = await measure(fn, repeat if mode != "full" or size < 100_000 else max(1, repeat // 10))
+                print(f"{size:>8} {mode:>6} {result['mean_ms']:>9.2f} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1_000, 100_000])
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.page_size, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
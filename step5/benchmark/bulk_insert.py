@@ -0,0 +1,79 @@
+"""Time and peak RSS of bulk creating books.
+
+``orm`` is the previous path: one ``BookModel`` per title, ``add_many`` and a Book per object.
+``items`` and ``ids`` are ``Repository.insert_many`` returning the books or only their ids.
+Each run happens in its own process, so the peak RSS belongs to that run alone.
+
+Run with ``python -m step5.benchmark.bulk_insert``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from step5.benchmark.common import seed, temporary_database
+from step5.common import from_orm
+from step5.controller.book import BookRepository
+from step5.model.book import Book, BookModel
+
+MODES = ("orm", "items", "ids")
+
+
+async def insert(size: int, mode: str) -> dict[str, float]:
+    async with temporary_database() as (engine, session_maker):
+        (author_id,) = await seed(engine, authors=1, books_per_author=0)
+        titles = [f"Book {i}" for i in range(size)]
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        async with session_maker() as session:
+            repo = BookRepository(session=session)
+            rows = ({"title": title, "author_id": author_id} for title in titles)
+            if mode == "orm":
+                result = from_orm(await repo.add_many([BookModel(**row) for row in rows]), list[Book])
+            elif mode == "items":
+                inserted = await repo.insert_many(rows, BookModel.id, BookModel.title, BookModel.author_id)
+                result = from_orm(inserted, list[Book])
+            else:
+                result = [row.id for row in await repo.insert_many(rows, BookModel.id)]
+            await session.commit()
+        elapsed = time.perf_counter() - start
+    assert len(result) == size
+    return {
+        "seconds": elapsed,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+    }
+
+
+def run(sizes: list[int]) -> None:
+    print(f"{'titles':>8} {'mode':>6} {'seconds':>9} {'peak RSS MB':>12} {'RSS growth MB':>14}")
+    for size in sizes:
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, "-m", "step5.benchmark.bulk_insert", "--single", str(size), mode],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output)
+            print(f"{size:>8} {mode:>6} {result['seconds']:>9.3f} {result['peak_rss_mb']:>12.1f} "
+                  f"{result['rss_growth_mb']:>14.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--single", nargs=2, metavar=("SIZE", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.single:
+        print(json.dumps(asyncio.run(insert(int(args.single[0]), args.single[1]))))
+    else:
+        run(args.sizes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Time from launching uvicorn to the first successful ``GET /authors``.
+
+``fresh`` starts on an empty database, ``stale`` on one whose recorded schema version is
+removed, so startup runs ``create_all`` like every boot used to, and ``current`` on one that
+is up to date, where startup is a single query. Each launch runs in a throw away directory,
+``DATABASE_URL`` is relative to it. ``startup ms`` is the database part of ``on_startup`` alone,
+measured in process, the launch time is mostly spent importing.
+
+Run with ``python -m step5.benchmark.cold_start``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from step5.benchmark.common import ROOT, ensure_openapi_schema, free_port
+from step5.db import build_write_engine, get_profile
+from step5.main import analyze
+from step5.schema import migrate_schema, schema_is_current
+
+MODES = ("fresh", "stale", "current")
+
+
+def launch(directory: Path, workers: int, timeout: float) -> float:
+    """Start the app in `directory`, return the seconds until ``GET /authors`` answers 200."""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "step5.main:app", "--port", str(port), "--workers", str(workers)],
+        cwd=directory,
+        env={**os.environ, "PYTHONPATH": str(ROOT), "PYTHONWARNINGS": "ignore"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/authors", timeout=timeout).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                pass
+            time.sleep(0.005)
+        raise TimeoutError(f"the app did not answer within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def startup(directory: Path) -> float:
+    """Run what `on_startup` does to the database in `directory`, return the milliseconds it took."""
+    engine = build_write_engine(f"sqlite+aiosqlite:///{directory / 'test.sqlite'}", get_profile())
+    try:
+        start = time.perf_counter()
+        async with engine.connect() as conn:
+            current = await conn.run_sync(schema_is_current)
+        if not current:
+            async with engine.begin() as conn:
+                await conn.run_sync(migrate_schema)
+                await analyze(conn)
+        return (time.perf_counter() - start) * 1000
+    finally:
+        await engine.dispose()
+
+
+def prepare(directory: Path, mode: str) -> None:
+    if mode == "fresh":
+        (directory / "test.sqlite").unlink(missing_ok=True)
+    elif mode == "stale":
+        with sqlite3.connect(directory / "test.sqlite") as conn:
+            conn.execute("DELETE FROM schema_version")
+
+
+def run(workers: int, repeat: int, timeout: float) -> None:
+    ensure_openapi_schema()
+    print(f"{'mode':>8} {'launch ms':>10} {'min ms':>9} {'max ms':>9} {'startup ms':>11}")
+    for mode in MODES:
+        timings = []
+        startups = []
+        with tempfile.TemporaryDirectory() as name:
+            directory = Path(name)
+            launch(directory, workers, timeout)  # creates the schema and records its version
+            for _ in range(repeat):
+                prepare(directory, mode)
+                timings.append(launch(directory, workers, timeout) * 1000)
+                prepare(directory, mode)
+                startups.append(asyncio.run(startup(directory)))
+        print(f"{mode:>8} {statistics.fmean(timings):>10.1f} {min(timings):>9.1f} {max(timings):>9.1f}"
+              f" {statistics.fmean(startups):>11.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+    run(args.workers, args.repeat, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
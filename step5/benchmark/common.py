@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
+from uuid import uuid4
+
+from advanced_alchemy.base import UUIDBase
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import step5
+from step5.db import build_engine
+from step5.model.author import AuthorModel
+from step5.model.book import BookModel
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+    from step5.db import SQLiteProfile
+
+SEED_CHUNK = 5_000
+ROOT = Path(step5.__file__).parent.parent
+"""Directory holding the step5 package, the ``PYTHONPATH`` of the servers the benchmarks launch."""
+
+
+@asynccontextmanager
+async def temporary_database(
+        profile: SQLiteProfile | None = None,
+) -> AsyncIterator[tuple[AsyncEngine, async_sessionmaker[AsyncSession]]]:
+    """Create an empty step5 schema in a throw away SQLite file, opened with `profile` when given."""
+    with tempfile.TemporaryDirectory() as directory:
+        engine = build_engine(f"sqlite+aiosqlite:///{Path(directory) / 'bench.sqlite'}", profile)
+        async with engine.begin() as conn:
+            await conn.run_sync(UUIDBase.metadata.create_all)
+        try:
+            yield engine, async_sessionmaker(engine, expire_on_commit=False)
+        finally:
+            await engine.dispose()
+
+
+async def seed(engine: AsyncEngine, authors: int, books_per_author: int) -> list[Any]:
+    """Insert `authors` authors with `books_per_author` books each, return the author ids."""
+    author_ids = [uuid4() for _ in range(authors)]
+    async with engine.begin() as conn:
+        await conn.execute(
+            AuthorModel.__table__.insert(),
+            [{"id": author_id, "name": f"Author {i}"} for i, author_id in enumerate(author_ids)],
+        )
+        rows = ({"title": f"Book {i}", "author_id": author_id}
+                for author_id in author_ids for i in range(books_per_author))
+        while chunk := [row for _, row in zip(range(SEED_CHUNK), rows)]:
+            await conn.execute(BookModel.__table__.insert(), chunk)
+        await conn.exec_driver_sql("ANALYZE")
+    return author_ids
+
+
+async def measure(fn: Callable[[], Awaitable[Any]], repeat: int) -> dict[str, float]:
+    """Call `fn` `repeat` times and summarize the latencies in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p99_ms": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def ensure_openapi_schema() -> None:
+    """Build the OpenAPI documents the app loads at startup, unless they already are."""
+    from step5.openapi import SCHEMA_DIRECTORY
+
+    if not (SCHEMA_DIRECTORY / "openapi.json").is_file():
+        subprocess.run([sys.executable, "-m", "step5.openapi"], cwd=ROOT, check=True, capture_output=True)
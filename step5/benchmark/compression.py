@@ -0,0 +1,104 @@
+"""CPU time per request and bytes sent for each compression setting.
+
+Each response body is sent through the compression middleware alone, by an ASGI app that
+does nothing else, so the CPU time is the compression cost. ``before`` is Litestar's
+middleware with the settings the app used to have (Brotli quality 5, 500 bytes minimum).
+The others are ``step5.compression.CompressionMiddleware`` with its default settings, only
+gzip, only zstd (when zstandard is installed) and the defaults with the compressed body cache.
+
+Run with ``python -m step5.benchmark.compression``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any
+from uuid import uuid4
+
+import msgspec
+from litestar.config.compression import CompressionConfig
+from litestar.middleware.compression import CompressionMiddleware as LitestarCompressionMiddleware
+
+from step5.cache import ResponseCache
+from step5.compression import ZSTD_AVAILABLE, CompressionMiddleware, CompressionSettings
+from step5.model.author import Author
+from step5.model.book import Book
+
+if TYPE_CHECKING:
+    from litestar.types import ASGIApp, Message
+
+_encoder = msgspec.json.Encoder()
+
+
+def payloads() -> dict[str, bytes]:
+    author_id = uuid4()
+    books = [Book(id=uuid4(), title=f"Book title number {i}", author_id=author_id) for i in range(1_000)]
+    return {
+        "404": b'{"status_code":404,"detail":"Not Found"}',
+        "author": _encoder.encode(Author(id=author_id, name="John Q Public")),
+        "10 books": _encoder.encode({"items": books[:10], "limit": 10, "offset": 0, "total": 1000}),
+        "100 books": _encoder.encode({"items": books[:100], "limit": 100, "offset": 0, "total": 1000}),
+        "1k books": _encoder.encode({"items": books, "limit": 1000, "offset": 0, "total": 1000}),
+    }
+
+
+def settings() -> dict[str, Any]:
+    setups: dict[str, Any] = {
+        "before": lambda app: LitestarCompressionMiddleware(
+            app, CompressionConfig(backend="brotli", brotli_quality=5, brotli_gzip_fallback=True)),
+        "default": lambda app: CompressionMiddleware(app),
+        "gzip": lambda app: CompressionMiddleware(app, CompressionSettings(encodings=("gzip",))),
+    }
+    if ZSTD_AVAILABLE:
+        setups["zstd"] = lambda app: CompressionMiddleware(app, CompressionSettings(encodings=("zstd",)))
+    setups["cached"] = lambda app: CompressionMiddleware(app, cache=ResponseCache(max_size=256, ttl=3600))
+    return setups
+
+
+async def run_one(middleware: ASGIApp, repeat: int) -> tuple[float, int]:
+    """Send the body `repeat` times, return the CPU microseconds per request and the bytes sent."""
+    sent = 0
+    scope = {
+        "type": "http", "path": "/", "state": {}, "route_handler": SimpleNamespace(opt={}),
+        "headers": [(b"accept-encoding", b"br, zstd, gzip")],
+    }
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        nonlocal sent
+        if message["type"] == "http.response.body":
+            sent = len(message["body"])
+
+    start = time.process_time()
+    for _ in range(repeat):
+        await middleware(dict(scope), receive, send)
+    return (time.process_time() - start) / repeat * 1e6, sent
+
+
+async def run(repeat: int) -> None:
+    print(f"{'body':>10} {'raw bytes':>10} {'setting':>8} {'CPU us':>8} {'bytes sent':>11}")
+    for name, body in payloads().items():
+
+        async def app(scope: Any, receive: Any, send: Any, body: bytes = body) -> None:
+            headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        for setting, build in settings().items():
+            cpu, sent = await run_one(build(app), repeat)
+            print(f"{name:>10} {len(body):>10} {setting:>8} {cpu:>8.1f} {sent:>11}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Throughput of concurrent readers and writers under each SQLite profile of ``step5.db``.
+
+Readers fetch a random page of ``GET /book?count=exact``, whose count holds a read
+transaction over the whole table. Writers rename a random book and commit. Each operation
+gets a session of its own like a request, every worker runs for the same duration and
+failed operations ("database is locked") are counted apart.
+
+Run with ``python -m step5.benchmark.concurrency``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+
+from advanced_alchemy.filters import LimitOffset
+from sqlalchemy import select, update
+from sqlalchemy.exc import OperationalError
+
+from step5.benchmark.common import seed, temporary_database
+from step5.controller.book import BookRepository
+from step5.db import PROFILES, SQLiteProfile
+from step5.model.book import BookModel
+from step5.pagination import CountMode
+
+
+async def run_profile(profile: SQLiteProfile, readers: int, writers: int, seconds: float) -> dict[str, float]:
+    async with temporary_database(profile) as (engine, session_maker):
+        await seed(engine, authors=100, books_per_author=100)
+        async with session_maker() as session:
+            book_ids = (await session.execute(select(BookModel.id))).scalars().all()
+        counts = {"reads": 0, "writes": 0, "errors": 0}
+        deadline = time.perf_counter() + seconds
+
+        async def read() -> None:
+            async with session_maker() as session:
+                await BookRepository(session=session).list_and_count_by_mode(
+                    LimitOffset(20, random.randrange(len(book_ids) - 20)), CountMode.EXACT)
+
+        async def write() -> None:
+            async with session_maker() as session:
+                await session.execute(
+                    update(BookModel)
+                    .where(BookModel.id == random.choice(book_ids))
+                    .values(title=f"Book {random.random()}", updated_at=datetime.now(timezone.utc))
+                )
+                await session.commit()
+
+        async def worker(operation, counter: str) -> None:
+            while time.perf_counter() < deadline:
+                try:
+                    await operation()
+                except OperationalError:
+                    counts["errors"] += 1
+                else:
+                    counts[counter] += 1
+
+        await asyncio.gather(*[worker(read, "reads") for _ in range(readers)],
+                             *[worker(write, "writes") for _ in range(writers)])
+    return {name: count / seconds for name, count in counts.items()}
+
+
+async def run(readers: int, writers: int, seconds: float) -> None:
+    print(f"{readers} readers, {writers} writers, {seconds:g}s per profile")
+    print(f"{'profile':>12} {'reads/s':>9} {'writes/s':>9} {'errors/s':>9}")
+    for name, profile in PROFILES.items():
+        result = await run_profile(profile, readers, writers, seconds)
+        print(f"{name:>12} {result['reads']:>9.0f} {result['writes']:>9.0f} {result['errors']:>9.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.readers, args.writers, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
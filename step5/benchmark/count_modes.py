@@ -0,0 +1,42 @@
+"""List latency against table size for each `CountMode`.
+
+Run with ``python -m step5.benchmark.count_modes``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+
+from advanced_alchemy.filters import LimitOffset
+
+from step5.benchmark.common import measure, seed, temporary_database
+from step5.controller.book import BookRepository
+from step5.pagination import CountMode
+
+
+async def run(sizes: list[int], repeat: int, page_size: int) -> None:
+    print(f"{'rows':>10} {'mode':>10} {'mean ms':>10} {'p99 ms':>10}")
+    for size in sizes:
+        async with temporary_database() as (engine, session_maker):
+            await seed(engine, authors=10, books_per_author=size // 10)
+            async with session_maker() as session:
+                repo = BookRepository(session=session)
+                for mode in CountMode:
+                    result = await measure(
+                        lambda: repo.list_and_count_by_mode(LimitOffset(page_size, 0), mode),
+                        repeat,
+                    )
+                    print(f"{size:>10} {mode.value:>10} {result['mean_ms']:>10.3f} {result['p99_ms']:>10.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat, args.page_size))
+
+
+if __name__ == "__main__":
+    main()
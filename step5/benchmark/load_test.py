@@ -0,0 +1,302 @@
+"""Throughput and latency of every author and book route under a concurrent read/write mix.
+
+The database is a temporary SQLite file seeded with ``--authors`` authors of ``--books-per-author``
+books each. ``--server inprocess`` drives ``step5.main:app`` through Litestar's ``AsyncTestClient``,
+``--server uvicorn`` launches it with uvicorn and goes through the network. ``--concurrency``
+clients send requests for ``--duration`` seconds, a ``--write-ratio`` share of them to the write
+routes, each route of a kind being equally likely. Every route is called once before measuring.
+
+The report is JSON, the request count, errors, throughput and p50/p95/p99 latency of each route
+and overall, with the settings and commit it was made with. ``--output`` writes it to a file, to
+compare runs over time.
+
+Run with ``python -m step5.benchmark.load_test``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+from uuid import UUID
+
+import httpx
+from sqlalchemy import select
+
+from step5.benchmark.common import ROOT, ensure_openapi_schema, free_port, seed
+from step5.db import build_engine
+from step5.model.book import BookModel
+from step5.schema import migrate_schema
+
+BATCH_SIZE = 10
+"""Ids per batch lookup, titles per bulk create and lines per import."""
+
+
+@dataclass
+class Context:
+    """What the clients share: the ids to pick from and the latencies recorded per route."""
+
+    client: httpx.AsyncClient
+    author_ids: list[UUID]
+    book_ids: list[UUID]
+    rng: random.Random = field(default_factory=random.Random)
+    recording: bool = False
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+    async def request(self, route: str, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        start = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        if self.recording:
+            self.latencies[route].append(elapsed)
+            if response.is_error:
+                self.errors[route] += 1
+        elif response.is_error:
+            raise RuntimeError(f"{route}: {method} {url} answered {response.status_code} {response.text[:200]}")
+        return response
+
+    def author_id(self) -> UUID:
+        return self.rng.choice(self.author_ids)
+
+    def book_id(self) -> UUID:
+        return self.rng.choice(self.book_ids)
+
+    def page(self) -> dict[str, int]:
+        pages = max(1, len(self.author_ids) // 10)
+        return {"currentPage": self.rng.randint(1, min(pages, 100)), "pageSize": 10}
+
+    def book(self) -> dict[str, str]:
+        return {"title": self.names("Book")[0], "author_id": str(self.author_id())}
+
+    def names(self, prefix: str) -> list[str]:
+        return [f"{prefix} {self.rng.getrandbits(32):08x}" for _ in range(BATCH_SIZE)]
+
+
+Scenario = Callable[[Context], Awaitable[Any]]
+
+
+async def create_author(ctx: Context) -> UUID:
+    response = await ctx.request("create_author", "POST", "/authors", json={"name": ctx.names("Author")[0]})
+    return UUID(response.json()["id"])
+
+
+async def delete_author(ctx: Context) -> None:
+    # deletes an author of its own, the seeded ones keep their books
+    await ctx.request("delete_author", "DELETE", f"/authors/{await create_author(ctx)}")
+
+
+async def create_book(ctx: Context) -> UUID:
+    return UUID((await ctx.request("create_book", "POST", "/book", json=ctx.book())).json()["id"])
+
+
+async def delete_book(ctx: Context) -> None:
+    await ctx.request("delete_book", "DELETE", f"/book/{await create_book(ctx)}")
+
+
+def ndjson(rows: list[dict[str, Any]]) -> bytes:
+    return b"".join(json.dumps(row).encode() + b"\n" for row in rows)
+
+
+READS: dict[str, Scenario] = {
+    "list_authors": lambda ctx: ctx.request("list_authors", "GET", "/authors", params=ctx.page()),
+    "list_authors count=estimated": lambda ctx: ctx.request(
+        "list_authors count=estimated", "GET", "/authors", params={**ctx.page(), "count": "estimated"}),
+    "list_authors count=none": lambda ctx: ctx.request(
+        "list_authors count=none", "GET", "/authors", params={**ctx.page(), "count": "none"}),
+    "list_authors fields": lambda ctx: ctx.request(
+        "list_authors fields", "GET", "/authors", params={**ctx.page(), "fields": "id,name"}),
+    "list_authors_by_cursor": lambda ctx: ctx.request("list_authors_by_cursor", "GET", "/authors/cursor"),
+    "get_author": lambda ctx: ctx.request("get_author", "GET", f"/authors/{ctx.author_id()}"),
+    "get_author fields": lambda ctx: ctx.request(
+        "get_author fields", "GET", f"/authors/{ctx.author_id()}", params={"fields": "name"}),
+    "get_author_and_books": lambda ctx: ctx.request(
+        "get_author_and_books", "GET", f"/authors/with-books/{ctx.author_id()}"),
+    "get_authors_batch": lambda ctx: ctx.request(
+        "get_authors_batch", "GET", "/authors/batch",
+        params={"ids": [str(ctx.author_id()) for _ in range(BATCH_SIZE)]}),
+    "export_authors": lambda ctx: ctx.request("export_authors", "GET", "/authors/export"),
+    "list_books": lambda ctx: ctx.request("list_books", "GET", "/book", params=ctx.page()),
+    "list_books count=estimated": lambda ctx: ctx.request(
+        "list_books count=estimated", "GET", "/book", params={**ctx.page(), "count": "estimated"}),
+    "list_books count=none": lambda ctx: ctx.request(
+        "list_books count=none", "GET", "/book", params={**ctx.page(), "count": "none"}),
+    "list_books fields": lambda ctx: ctx.request(
+        "list_books fields", "GET", "/book", params={**ctx.page(), "fields": "id,title"}),
+    "list_books_by_cursor": lambda ctx: ctx.request("list_books_by_cursor", "GET", "/book/cursor"),
+    "get_book": lambda ctx: ctx.request("get_book", "GET", f"/book/{ctx.book_id()}"),
+    "get_book fields": lambda ctx: ctx.request(
+        "get_book fields", "GET", f"/book/{ctx.book_id()}", params={"fields": "title"}),
+    "get_books_batch": lambda ctx: ctx.request(
+        "get_books_batch", "GET", "/book/batch", params={"ids": [str(ctx.book_id()) for _ in range(BATCH_SIZE)]}),
+    "export_books": lambda ctx: ctx.request("export_books", "GET", "/book/export"),
+}
+WRITES: dict[str, Scenario] = {
+    "create_author": create_author,
+    "put_author": lambda ctx: ctx.request(
+        "put_author", "PUT", f"/authors/{ctx.author_id()}", json={"name": ctx.names("Author")[0], "dob": None}),
+    "patch_author": lambda ctx: ctx.request(
+        "patch_author", "PATCH", f"/authors/{ctx.author_id()}", json={"name": ctx.names("Author")[0]}),
+    "delete_author": delete_author,
+    "import_authors": lambda ctx: ctx.request(
+        "import_authors", "POST", "/authors/import", content=ndjson([{"name": name} for name in ctx.names("Author")]),
+        headers={"content-type": "application/x-ndjson"}),
+    "create_book": create_book,
+    "bulk_create_book": lambda ctx: ctx.request(
+        "bulk_create_book", "POST", "/book/bulk", json={"title": ctx.names("Book"), "author_id": str(ctx.author_id())}),
+    "put_book": lambda ctx: ctx.request("put_book", "PUT", f"/book/{ctx.book_id()}", json=ctx.book()),
+    "patch_book": lambda ctx: ctx.request("patch_book", "PATCH", f"/book/{ctx.book_id()}", json=ctx.book()),
+    "delete_book": delete_book,
+    "import_books": lambda ctx: ctx.request(
+        "import_books", "POST", "/book/import",
+        content=ndjson([{"title": title, "author_id": str(ctx.author_id())} for title in ctx.names("Book")]),
+        headers={"content-type": "application/x-ndjson"}),
+}
+
+
+async def seed_database(url: str, authors: int, books_per_author: int) -> tuple[list[UUID], list[UUID]]:
+    """Create the schema the way the app does and seed it, return the author and book ids."""
+    engine = build_engine(url)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(migrate_schema)
+        author_ids = await seed(engine, authors=authors, books_per_author=books_per_author)
+        async with engine.connect() as conn:
+            book_ids = list((await conn.execute(select(BookModel.id))).scalars())
+        return author_ids, book_ids
+    finally:
+        await engine.dispose()
+
+
+@asynccontextmanager
+async def inprocess_client() -> AsyncIterator[httpx.AsyncClient]:
+    from litestar.testing import AsyncTestClient
+
+    from step5.main import app  # after DATABASE_URL is set, the engines are built on import
+
+    async with AsyncTestClient(app=app) as client:
+        yield client
+
+
+@asynccontextmanager
+async def uvicorn_client(workers: int, timeout: float = 30.0) -> AsyncIterator[httpx.AsyncClient]:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "step5.main:app", "--port", str(port), "--workers", str(workers)],
+        env={**os.environ, "PYTHONPATH": str(ROOT), "PYTHONWARNINGS": "ignore"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            deadline = time.perf_counter() + timeout
+            while True:
+                try:
+                    if (await client.get("/authors")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    if time.perf_counter() > deadline:
+                        raise
+                await asyncio.sleep(0.05)
+            yield client
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def summarize(latencies: list[float], errors: int, duration: float) -> dict[str, float]:
+    latencies = sorted(latencies)
+
+    def percentile(q: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * q))], 3)
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / duration, 1),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    reads = {name: fn for name, fn in READS.items() if not args.routes or name in args.routes}
+    writes = {name: fn for name, fn in WRITES.items() if not args.routes or name in args.routes}
+    ensure_openapi_schema()
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite+aiosqlite:///{Path(directory) / 'load.sqlite'}"
+        author_ids, book_ids = await seed_database(url, args.authors, args.books_per_author)
+        os.environ["DATABASE_URL"] = url
+        clients = inprocess_client() if args.server == "inprocess" else uvicorn_client(args.workers)
+        async with clients as client:
+            ctx = Context(client, author_ids, book_ids, random.Random(args.seed))
+            for scenario in (*reads.values(), *writes.values()):
+                await scenario(ctx)
+            ctx.recording = True
+
+            async def worker() -> None:
+                while time.perf_counter() < deadline:
+                    scenarios = writes if writes and (not reads or ctx.rng.random() < args.write_ratio) else reads
+                    await ctx.rng.choice(list(scenarios.values()))(ctx)
+
+            start = time.perf_counter()
+            deadline = start + args.duration
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            duration = time.perf_counter() - start
+    every_latency = [latency for latencies in ctx.latencies.values() for latency in latencies]
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "total": summarize(every_latency, sum(ctx.errors.values()), duration),
+        "routes": {route: summarize(ctx.latencies[route], ctx.errors[route], duration)
+                   for route in sorted(ctx.latencies)},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--authors", type=int, default=1_000)
+    parser.add_argument("--books-per-author", type=int, default=10)
+    parser.add_argument("--routes", nargs="+", choices=sorted({*READS, *WRITES}), help="all of them by default")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random choices")
+    parser.add_argument("--output", type=Path, help="also write the report to this file")
+    args = parser.parse_args()
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    print(report)
+    if args.output is not None:
+        args.output.write_text(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
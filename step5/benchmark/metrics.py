@@ -0,0 +1,94 @@
+"""CPU time the metrics add to a request, and to each database statement.
+
+``request`` sends a small JSON body through an ASGI app that does nothing else, bare and
+wrapped in ``step5.metrics.MetricsMiddleware``. ``statement`` runs ``SELECT 1`` on an
+in-memory SQLite engine, bare and instrumented, from within a request. It uses the
+synchronous driver, the thread of aiosqlite would drown the cost of the engine events.
+
+Run with ``python -m step5.benchmark.metrics``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import create_engine, text
+
+from step5.metrics import Metrics, MetricsMiddleware
+from step5.statements import instrument, track, untrack
+
+if TYPE_CHECKING:
+    from litestar.types import ASGIApp, Message
+
+BODY = b'{"id":"97108ac1-ffcb-411d-8b1e-d9183399f63b","name":"John Q Public"}'
+
+
+async def app(scope: Any, receive: Any, send: Any) -> None:
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(BODY)).encode())]
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    await send({"type": "http.response.body", "body": BODY})
+
+
+async def per_request(asgi_app: ASGIApp, repeat: int) -> float:
+    """CPU microseconds per request through `asgi_app`."""
+    handler = SimpleNamespace(opt={})
+    routes = [SimpleNamespace(path_format="/authors/{author_id}", route_handlers=[handler])]
+    scope = {
+        "type": "http", "method": "GET", "path": "/authors/1", "state": {}, "headers": [],
+        "route_handler": handler, "app": SimpleNamespace(routes=routes),
+    }
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        pass
+
+    start = time.process_time()
+    for _ in range(repeat):
+        await asgi_app(dict(scope), receive, send)
+    return (time.process_time() - start) / repeat * 1e6
+
+
+def per_statement(instrumented: bool, repeat: int) -> float:
+    """CPU microseconds per ``SELECT 1``, within a request."""
+    engine = create_engine("sqlite://")
+    if instrumented:
+        # `instrument` only needs the synchronous engine behind an async one
+        instrument(SimpleNamespace(sync_engine=engine))  # type: ignore[arg-type]
+    _, token = track()
+    try:
+        with engine.connect() as conn:
+            statement = text("SELECT 1")
+            conn.execute(statement)
+            start = time.process_time()
+            for _ in range(repeat):
+                conn.execute(statement)
+            return (time.process_time() - start) / repeat * 1e6
+    finally:
+        untrack(token)
+        engine.dispose()
+
+
+async def run(repeat: int) -> None:
+    print(f"{'measure':>10} {'bare us':>8} {'metrics us':>11} {'added us':>9}")
+    bare = await per_request(app, repeat)
+    measured = await per_request(MetricsMiddleware(app, Metrics()), repeat)
+    print(f"{'request':>10} {bare:>8.1f} {measured:>11.1f} {measured - bare:>9.1f}")
+    bare = per_statement(False, repeat)
+    measured = per_statement(True, repeat)
+    print(f"{'statement':>10} {bare:>8.1f} {measured:>11.1f} {measured - bare:>9.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Read latency while bulk writes are running, with and without the read-only pool.
+
+Readers fetch random books the way ``GET /book/{id}`` does while one writer keeps inserting
+chunks of books with ``Repository.insert_many``, like ``/book/bulk``.
+
+``before`` is one engine with SQLite's own settings and a new connection per session, as the
+app had before the profiles. ``shared`` is the same engine with the ``production`` profile.
+``split`` is the app's setup, the writer engine and the pooled read-only engine of ``step5.db``.
+Everything runs on one event loop, so building a write chunk delays the readers too and
+shows in p99 whatever the setup.
+
+Run with ``python -m step5.benchmark.read_latency``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from advanced_alchemy.base import UUIDBase
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from step5.benchmark.common import seed
+from step5.controller.book import BookRepository
+from step5.db import PROFILES, build_engine, build_read_engine, build_write_engine
+from step5.model.book import BookModel
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator
+
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+SETUPS = ("before", "shared", "split")
+WRITE_CHUNK = 1_000
+
+
+@asynccontextmanager
+async def engines(setup: str) -> AsyncIterator[tuple[AsyncEngine, AsyncEngine]]:
+    """Create the (read, write) engines of `setup` on a throw away database."""
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite+aiosqlite:///{Path(directory) / 'bench.sqlite'}"
+        if setup == "before":
+            read = write = build_engine(url, PROFILES["rollback"])
+        elif setup == "shared":
+            read = write = build_engine(url, PROFILES["production"])
+        else:
+            write = build_write_engine(url, PROFILES["production"])
+            read = build_read_engine(url, PROFILES["production"])
+        async with write.begin() as conn:
+            await conn.run_sync(UUIDBase.metadata.create_all)
+        try:
+            yield read, write
+        finally:
+            await read.dispose()
+            await write.dispose()
+
+
+async def run_setup(setup: str, readers: int, seconds: float) -> dict[str, float]:
+    async with engines(setup) as (read_engine, write_engine):
+        (author_id,) = await seed(write_engine, authors=1, books_per_author=10_000)
+        read_sessions = async_sessionmaker(read_engine, expire_on_commit=False)
+        write_sessions = async_sessionmaker(write_engine, expire_on_commit=False)
+        async with read_sessions() as session:
+            book_ids = (await session.execute(select(BookModel.id))).scalars().all()
+        timings: list[float] = []
+        written = 0
+        deadline = time.perf_counter() + seconds
+
+        async def read() -> None:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                async with read_sessions() as session:
+                    await BookRepository(session=session).get(random.choice(book_ids))
+                timings.append((time.perf_counter() - start) * 1000)
+
+        async def write() -> None:
+            nonlocal written
+            while time.perf_counter() < deadline:
+                async with write_sessions() as session:
+                    rows = ({"title": f"Bulk {i}", "author_id": author_id} for i in range(WRITE_CHUNK))
+                    await BookRepository(session=session).insert_many(rows)
+                    await session.commit()
+                written += WRITE_CHUNK
+
+        await asyncio.gather(write(), *[read() for _ in range(readers)])
+    timings.sort()
+    return {
+        "reads_per_s": len(timings) / seconds,
+        "p50_ms": timings[len(timings) // 2],
+        "p99_ms": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        "rows_written_per_s": written / seconds,
+    }
+
+
+async def run(readers: int, seconds: float) -> None:
+    print(f"{readers} readers, 1 bulk writer, {seconds:g}s per setup")
+    print(f"{'setup':>8} {'reads/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'rows written/s':>15}")
+    for setup in SETUPS:
+        result = await run_setup(setup, readers, seconds)
+        print(f"{setup:>8} {result['reads_per_s']:>9.0f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+              f"{result['rows_written_per_s']:>15.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.readers, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Throughput of turning a page of ORM rows into JSON, Pydantic vs msgspec.
+
+``pydantic`` is the path the handlers used before: ``TypeAdapter(list[Schema])`` built per
+call, ``validate_python`` with ``from_attributes`` and Litestar encoding the models.
+``msgspec`` is the current ``from_orm`` into ``BaseStruct`` schemas.
+
+Run with ``python -m step5.benchmark.serialization``.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import date
+from typing import Any, Callable
+from uuid import UUID, uuid4
+
+import pydantic
+from litestar.pagination import OffsetPagination
+from litestar.serialization import encode_json, get_serializer
+
+from step5.common import BaseModel, from_orm
+from step5.model.author import Author, AuthorModel
+from step5.model.book import Book, BookModel
+
+pydantic_serializer = get_serializer({pydantic.BaseModel: lambda m: m.model_dump(mode="json")})
+
+
+class PydanticAuthor(BaseModel):
+    id: UUID | None
+    name: str
+    dob: date | None = None
+
+
+class PydanticBook(BaseModel):
+    id: UUID | None
+    title: str
+    author_id: UUID
+
+
+def pydantic_page(rows: list[Any], schema: type[BaseModel]) -> bytes:
+    type_adapter = pydantic.TypeAdapter(list[schema])  # type: ignore[valid-type]
+    page = OffsetPagination(items=type_adapter.validate_python(rows), total=len(rows), limit=len(rows), offset=0)
+    return encode_json(page, pydantic_serializer)
+
+
+def msgspec_page(rows: list[Any], schema: type[Any]) -> bytes:
+    page = OffsetPagination(items=from_orm(rows, list[schema]), total=len(rows), limit=len(rows), offset=0)
+    return encode_json(page)
+
+
+def throughput(fn: Callable[[], bytes], seconds: float) -> float:
+    """Pages per second that `fn` manages to render within `seconds`."""
+    calls = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        fn()
+        calls += 1
+    return calls / seconds
+
+
+def run(page_sizes: list[int], seconds: float) -> None:
+    author_id = uuid4()
+    print(f"{'schema':>8} {'items':>6} {'pydantic pages/s':>17} {'msgspec pages/s':>16} {'speedup':>8}")
+    for size in page_sizes:
+        datasets = (
+            ("Author", [AuthorModel(id=uuid4(), name=f"Author {i}", dob=date(1970, 1, 1)) for i in range(size)],
+             PydanticAuthor, Author),
+            ("Book", [BookModel(id=uuid4(), title=f"Book {i}", author_id=author_id) for i in range(size)],
+             PydanticBook, Book),
+        )
+        for name, rows, pydantic_schema, struct_schema in datasets:
+            assert pydantic_page(rows, pydantic_schema) == msgspec_page(rows, struct_schema)
+            before = throughput(lambda: pydantic_page(rows, pydantic_schema), seconds)
+            after = throughput(lambda: msgspec_page(rows, struct_schema), seconds)
+            print(f"{name:>8} {size:>6} {before:>17.1f} {after:>16.1f} {after / before:>7.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[10, 100, 1_000])
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent on each measurement")
+    args = parser.parse_args()
+    run(args.page_sizes, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Cost of each stage of turning rows into a response, for every schema of every tutorial step.
+
+For the schemas returned from ORM objects the stages are ``rows`` (a Core ``SELECT`` of the
+page), ``orm`` (the same page as model instances, with the relationships the model loads),
+``validate`` (into the schema the way the step's controllers do it: ``TypeAdapter(list[...])``
+or ``from_orm``), ``encode`` (to JSON like Litestar does) and ``compress`` (with the step's
+compression settings, none before step3). The other schemas, request bodies mostly, are
+validated from a JSON payload instead: a list of as many objects, or one object whose lists
+hold as many items.
+
+The steps declare the same tables, so each one is measured in a process of its own, against
+a temporary SQLite file. Times are microseconds per page.
+
+Run with ``python -m step5.benchmark.stages``.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable
+from uuid import UUID, uuid4
+
+import brotli
+import msgspec
+import pydantic
+from litestar.serialization import encode_json, get_serializer
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session, selectinload
+
+from step5.common import from_orm
+from step5.compression import CompressionSettings, compress
+
+STEPS = {
+    "initial": ["initial.app"],
+    "step1": ["step1.model.book", "step1.model.author"],
+    "step2": ["step2.model.book", "step2.model.author"],
+    "step3": ["step3.model.book", "step3.model.author"],
+    "step4": ["step4.model.book", "step4.model.author"],
+    "step5": ["step5.model.book", "step5.model.author"],
+}
+STAGES = ("rows", "orm", "validate", "encode", "compress")
+# the bases of the schemas, not schemas themselves
+BASES = ("BaseModel", "BaseStruct")
+
+pydantic_serializer = get_serializer({pydantic.BaseModel: lambda m: m.model_dump(mode="json")})
+
+
+def encode(value: Any) -> bytes:
+    """Encode like Litestar, Pydantic models through `model_dump`, Structs natively."""
+    return encode_json(value, pydantic_serializer)
+
+
+def compressor(step: str) -> Callable[[bytes], bytes] | None:
+    """Compress like the app of `step`, ``None`` when it does not compress."""
+    if step in ("step3", "step4"):
+        return lambda body: brotli.compress(body, quality=5)
+    if step == "step5":
+        settings = CompressionSettings()
+        level = settings.level("br", "application/json")
+        return lambda body: body if len(body) < settings.minimum_size else compress(body, "br", level)
+    return None
+
+
+def schemas(step: str) -> tuple[dict[str, type], dict[str, type]]:
+    """Import the modules of `step`, return its ORM models and its schemas by name."""
+    models: dict[str, type] = {}
+    found: dict[str, type] = {}
+    for name in STEPS[step]:
+        module = importlib.import_module(name)
+        for attr, value in vars(module).items():
+            if not isinstance(value, type) or value.__module__ != module.__name__ or attr in BASES:
+                continue
+            if attr.endswith("Model") and hasattr(value, "__table__"):
+                models[attr] = value
+            elif issubclass(value, (pydantic.BaseModel, msgspec.Struct)):
+                found[attr] = value
+    return models, found
+
+
+def field_types(schema: type) -> dict[str, Any]:
+    if issubclass(schema, msgspec.Struct):
+        return {field.name: field.type for field in msgspec.structs.fields(schema)}
+    return {name: field.annotation for name, field in schema.model_fields.items()}
+
+
+def sample(annotation: Any, size: int) -> Any:
+    """A JSON value of `annotation`, with `size` items when it is a list."""
+    origin = typing.get_origin(annotation)
+    if origin is list:
+        return [sample(typing.get_args(annotation)[0], size) for _ in range(size)]
+    if origin is not None:  # an optional, sample the first type that is not None
+        return sample(next(arg for arg in typing.get_args(annotation) if arg is not type(None)), size)
+    if annotation is UUID:
+        return str(uuid4())
+    if annotation is date:
+        return "1970-01-01"
+    if annotation is int:
+        return size
+    return f"sample {uuid4().hex[:8]}"
+
+
+def per_call(fn: Callable[[], Any], seconds: float) -> float:
+    """Microseconds per call of `fn`, called for about `seconds`."""
+    calls = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        fn()
+        calls += 1
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def validator(schema: type, from_json: bool, many: bool = True) -> Callable[[Any], Any]:
+    """Validate like the controllers of the step: a `TypeAdapter` per call, or msgspec.
+
+    From ORM objects, or from a JSON payload holding a list of `schema` when `many`, one otherwise.
+    """
+    target: Any = list[schema] if many else schema  # type: ignore[valid-type]
+    if issubclass(schema, msgspec.Struct):
+        if from_json:
+            return lambda payload: msgspec.json.decode(payload, type=target)
+        return lambda rows: from_orm(rows, target)
+    if from_json:
+        return lambda payload: pydantic.TypeAdapter(target).validate_json(payload)
+    return lambda rows: pydantic.TypeAdapter(target).validate_python(rows)
+
+
+def measure_step(step: str, page_sizes: list[int], seconds: float) -> list[dict[str, Any]]:
+    models, found = schemas(step)
+    author_model, book_model = models["AuthorModel"], models["BookModel"]
+    compress_body = compressor(step)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{Path(directory) / 'stages.sqlite'}")
+        author_model.metadata.create_all(engine)
+        size = max(page_sizes)
+        with engine.begin() as conn:
+            author_ids = [uuid4() for _ in range(size)]
+            conn.execute(insert(author_model), [
+                {"id": author_id, "name": f"Author {i}", "dob": date(1970, 1, 1)}
+                for i, author_id in enumerate(author_ids)])
+            conn.execute(insert(book_model), [{"title": f"Book {i}", "author_id": author_ids[0]} for i in range(size)])
+        for name, schema in sorted(found.items()):
+            types = field_types(schema)
+            model = author_model if name.startswith("Author") else book_model
+            from_rows = "id" in types
+            for size in page_sizes:
+                timings: dict[str, float | None] = dict.fromkeys(STAGES)
+                if from_rows:
+                    statement = select(model).limit(size)
+                    if "books" in types:
+                        statement = statement.options(selectinload(model.books))
+
+                    def load(statement: Any = statement) -> list[Any]:
+                        with Session(engine) as session:
+                            return list(session.scalars(statement))
+
+                    def fetch(core: Any = select(model.__table__).limit(size)) -> list[Any]:
+                        with engine.connect() as conn:
+                            return list(conn.execute(core))
+
+                    timings["rows"] = per_call(fetch, seconds)
+                    timings["orm"] = per_call(load, seconds)
+                    source, validate = load(), validator(schema, from_json=False)
+                else:
+                    # a schema with lists gets one object with `size` items in each, others `size` objects
+                    one = not any(typing.get_origin(annotation) is list for annotation in types.values())
+                    objects = [{field: sample(annotation, size) for field, annotation in types.items()}
+                               for _ in range(size if one else 1)]
+                    source = json.dumps(objects if one else objects[0]).encode()
+                    validate = validator(schema, from_json=True, many=one)
+                timings["validate"] = per_call(lambda: validate(source), seconds)
+                validated = validate(source)
+                timings["encode"] = per_call(lambda: encode(validated), seconds)
+                body = encode(validated)
+                compressed = None
+                if compress_body is not None:
+                    timings["compress"] = per_call(lambda: compress_body(body), seconds)
+                    compressed = len(compress_body(body))
+                results.append({
+                    "step": step, "schema": name, "items": size, "bytes": len(body), "compressed_bytes": compressed,
+                    **{f"{stage}_us": None if value is None else round(value, 1) for stage, value in timings.items()},
+                })
+        engine.dispose()
+    return results
+
+
+def run(steps: list[str], page_sizes: list[int], seconds: float) -> list[dict[str, Any]]:
+    results = []
+    for step in steps:
+        output = subprocess.run(
+            [sys.executable, "-m", "step5.benchmark.stages", "--child", "--steps", step,
+             "--page-sizes", *map(str, page_sizes), "--seconds", str(seconds)],
+            env={**os.environ, "PYTHONWARNINGS": "ignore"},
+            capture_output=True, text=True, check=True,
+        ).stdout
+        results.extend(json.loads(output))
+    return results
+
+
+def print_table(results: list[dict[str, Any]]) -> None:
+    print(f"{'schema':>16} {'items':>6} {'step':>8} " + " ".join(f"{stage + ' us':>11}" for stage in STAGES)
+          + f" {'bytes':>8} {'sent':>8}")
+    for result in sorted(results, key=lambda r: (r["schema"], r["items"], list(STEPS).index(r["step"]))):
+        stages = " ".join("-".rjust(11) if result[f"{stage}_us"] is None else f"{result[f'{stage}_us']:>11.1f}"
+                          for stage in STAGES)
+        sent = result["compressed_bytes"] if result["compressed_bytes"] is not None else result["bytes"]
+        print(f"{result['schema']:>16} {result['items']:>6} {result['step']:>8} {stages}"
+              f" {result['bytes']:>8} {sent:>8}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", nargs="+", choices=list(STEPS), default=list(STEPS))
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--seconds", type=float, default=0.2, help="time spent on each measurement")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON instead of a table")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(measure_step(args.steps[0], args.page_sizes, args.seconds)))
+        return
+    results = run(args.steps, args.page_sizes, args.seconds)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
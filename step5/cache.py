@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+# routes whose responses are cached, used as the first part of the keys
+AUTHOR = "author"
+AUTHOR_WITH_BOOKS = "author-with-books"
+BOOK = "book"
+
+
+class ResponseCache:
+    """In process LRU cache of response objects with a time to live.
+
+    Entries are keyed by ``(route, entity id)``. An entry can also be tagged with the keys of
+    other entities it contains, invalidating one of those keys drops the entry too.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any, tuple[Hashable, ...]]] = OrderedDict()
+        self._tagged: dict[Hashable, set[Hashable]] = {}
+
+    def get(self, key: Hashable) -> Any | None:
+        """Get the cached value for `key`, ``None`` when it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: T, tags: Iterable[Hashable] = ()) -> T:
+        """Cache `value` under `key` and return it."""
+        if key in self._entries:
+            self._remove(key)
+        tags = tuple(tags)
+        self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self._tagged.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        return value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        """Drop the entries stored under `keys` and every entry tagged with one of them."""
+        for key in keys:
+            for tagged_key in self._tagged.pop(key, ()):
+                self._remove(tagged_key)
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tagged.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
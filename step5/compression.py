@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import hashlib
+import time
+import zlib
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+import brotli
+from litestar.datastructures import Headers, MutableScopeHeaders
+from litestar.enums import ScopeType
+from litestar.middleware import AbstractMiddleware
+
+from step5.timing import COMPRESS, add
+
+try:
+    import zstandard
+except ImportError:  # zstd is only offered when the optional zstandard package is installed
+    zstandard = None
+
+if TYPE_CHECKING:
+    from litestar.types import ASGIApp, Message, Receive, Scope, Send
+
+    from step5.cache import ResponseCache
+
+SKIP_COMPRESSION_OPT_KEY = "skip_compression"
+"""Route opt key telling `CompressionMiddleware` to leave the response alone."""
+UNCOMPRESSED_SIZE_STATE_KEY = "uncompressed_size"
+"""Scope state key of the body size before compression, set when the middleware compressed it."""
+ZSTD_AVAILABLE = zstandard is not None
+
+
+@dataclass(frozen=True)
+class CompressionSettings:
+    """What `CompressionMiddleware` compresses, and how hard."""
+
+    minimum_size: int = 1_024
+    """Smaller bodies are sent as is, they fit in a packet or two anyway."""
+    encodings: tuple[str, ...] = ("br", "zstd", "gzip")
+    """Encodings offered, in order of preference. zstd is skipped when zstandard is missing."""
+    brotli_quality: int = 4
+    brotli_quality_by_type: dict[str, int] = field(default_factory=lambda: {"text/html": 6, "text/css": 6})
+    """Quality for some media types, others get `brotli_quality`."""
+    gzip_level: int = 6
+    zstd_level: int = 3
+    compressible_types: tuple[str, ...] = (
+        "application/json", "application/x-ndjson", "application/javascript", "image/svg+xml", "text/",
+    )
+    """Media types, or prefixes of them, worth compressing."""
+    max_cached_size: int = 64 * 1024
+    """Largest body whose compressed form is kept in the cache."""
+
+    def __post_init__(self) -> None:
+        if not ZSTD_AVAILABLE:
+            object.__setattr__(self, "encodings", tuple(e for e in self.encodings if e != "zstd"))
+
+    def level(self, encoding: str, media_type: str) -> int:
+        if encoding == "br":
+            return self.brotli_quality_by_type.get(media_type, self.brotli_quality)
+        return self.gzip_level if encoding == "gzip" else self.zstd_level
+
+
+def pick_encoding(accept_encoding: str, supported: Iterable[str]) -> str | None:
+    """Pick the first of `supported` the `Accept-Encoding` header allows, ``None`` when there is none."""
+    accepted = set()
+    for value in accept_encoding.split(","):
+        coding, _, params = value.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(coding.strip())
+    return next((encoding for encoding in supported if encoding in accepted), None)
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    return zlib.compress(body, level, wbits=16 + zlib.MAX_WBITS)
+
+
+class CompressionMiddleware(AbstractMiddleware):
+    """Compress response bodies according to `CompressionSettings`, with a cache of compressed bodies.
+
+    Only bodies sent in one message are compressed, streamed responses compress themselves
+    (see `export_response`). The cache is keyed by a hash of the body, so a hot page that has
+    not changed is compressed once, whatever request produced it.
+    """
+
+    scopes = {ScopeType.HTTP}
+    exclude_opt_key = SKIP_COMPRESSION_OPT_KEY
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            settings: CompressionSettings | None = None,
+            cache: ResponseCache | None = None,
+    ) -> None:
+        super().__init__(app)
+        self.settings = settings or CompressionSettings()
+        self.cache = cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = pick_encoding(Headers.from_scope(scope).get("accept-encoding", ""), self.settings.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        start: Message | None = None
+        streaming = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, streaming
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is not None and message["type"] == "http.response.body" and not streaming:
+                if message.get("more_body", False):
+                    streaming = True
+                else:
+                    body = message["body"]
+                    message["body"] = self._compress(start, body, encoding)
+                    if message["body"] is not body:
+                        scope.setdefault("state", {})[UNCOMPRESSED_SIZE_STATE_KEY] = len(body)
+                await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _compress(self, start: Message, body: bytes, encoding: str) -> bytes:
+        headers = MutableScopeHeaders.from_message(start)
+        media_type = headers.get("content-type", "").partition(";")[0].strip()
+        if not media_type.startswith(self.settings.compressible_types) or "content-encoding" in headers:
+            return body
+        headers.extend_header_value("vary", "Accept-Encoding")
+        if len(body) < self.settings.minimum_size:
+            return body
+        level = self.settings.level(encoding, media_type)
+        key = (encoding, level, hashlib.blake2b(body, digest_size=16).digest())
+        compressed = self.cache.get(key) if self.cache is not None else None
+        if compressed is None:
+            start = time.perf_counter()
+            compressed = compress(body, encoding, level)
+            add(COMPRESS, start)
+            if self.cache is not None and len(body) <= self.settings.max_cached_size:
+                self.cache.set(key, compressed)
+        if len(compressed) >= len(body):
+            return body
+        headers["content-encoding"] = encoding
+        headers["content-length"] = str(len(compressed))
+        return compressed
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import hashlib
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import TYPE_CHECKING, Any
+
+from litestar import Request, Response
+from litestar.datastructures import MutableScopeHeaders
+from litestar.exceptions import HTTPException
+from litestar.status_codes import HTTP_200_OK, HTTP_304_NOT_MODIFIED
+
+if TYPE_CHECKING:
+    from logging import Logger
+
+    from litestar.types import Message, Scope
+    from litestar.types.callable_types import ExceptionLoggingHandler
+
+VALIDATOR_STATE_KEY = "validator"
+
+
+@dataclass(frozen=True)
+class Validator:
+    """ETag and Last-Modified values describing one version of a response."""
+
+    etag: str
+    last_modified: datetime | None = None
+
+    @classmethod
+    def of(cls, *parts: Any, last_modified: datetime | None = None) -> Validator:
+        """Build a weak validator out of the values the response is made from, e.g. `(id, updated_at)`."""
+        digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+        return cls(etag=f'W/"{digest}"', last_modified=last_modified)
+
+    def variant(self, *parts: Any) -> Validator:
+        """Build the validator of another representation of the same version, e.g. a subset of its fields."""
+        return Validator.of(self.etag, *parts, last_modified=self.last_modified)
+
+    @property
+    def headers(self) -> dict[str, str]:
+        headers = {"etag": self.etag}
+        if self.last_modified is not None:
+            headers["last-modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+
+class NotModifiedException(HTTPException):
+    """The client's copy of the resource is current."""
+
+    status_code = HTTP_304_NOT_MODIFIED
+
+
+def is_conditional(request: Request) -> bool:
+    """Whether the request carries a validator that could be answered with a 304."""
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def _is_fresh(request: Request, validator: Validator) -> bool:
+    if (if_none_match := request.headers.get("if-none-match")) is not None:
+        # weak comparison, If-Modified-Since is ignored when If-None-Match is present
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or validator.etag.removeprefix("W/") in tags
+    if validator.last_modified is not None and (if_modified_since := request.headers.get("if-modified-since")):
+        try:
+            return validator.last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def check_not_modified(request: Request, validator: Validator, headers: dict[str, str] | None = None) -> None:
+    """Raise `NotModifiedException` when the client's copy is current.
+
+    Otherwise the validator is remembered and sent with the response by `send_validator_headers`.
+    `headers` are sent with the 304 too, e.g. the `Cache-Control` of the full response.
+    """
+    if _is_fresh(request, validator):
+        raise NotModifiedException(headers={**validator.headers, **(headers or {})})
+    request.state[VALIDATOR_STATE_KEY] = validator
+
+
+def not_modified_handler(_: Request, exc: NotModifiedException) -> Response:
+    """Answer with an empty 304, so nothing gets serialized or compressed."""
+    return Response(content=None, status_code=HTTP_304_NOT_MODIFIED, headers=exc.headers)
+
+
+def quiet_not_modified(handler: ExceptionLoggingHandler) -> ExceptionLoggingHandler:
+    """Wrap the `exception_logging_handler` of a logging config to leave out the 304s, answers rather than errors.
+
+    In debug mode it logs the traceback of every exception, one per conditional hit otherwise.
+    """
+
+    def log_exception(logger: Logger, scope: Scope, tb: list[str]) -> None:
+        if not isinstance(sys.exc_info()[1], NotModifiedException):
+            handler(logger, scope, tb)
+
+    return log_exception
+
+
+async def send_validator_headers(message: Message, scope: Scope) -> None:
+    """`before_send` hook adding the ETag/Last-Modified headers to successful responses."""
+    if message["type"] != "http.response.start" or message["status"] != HTTP_200_OK:
+        return
+    validator: Validator | None = scope.get("state", {}).get(VALIDATOR_STATE_KEY)
+    if validator is not None:
+        headers = MutableScopeHeaders.from_message(message)
+        for name, value in validator.headers.items():
+            headers[name] = value
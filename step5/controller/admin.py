@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import hmac
+from typing import TYPE_CHECKING
+
+from litestar import get
+from litestar.controller import Controller
+from litestar.exceptions import NotAuthorizedException
+from litestar.params import Parameter
+
+from step5.cache import ResponseCache
+from step5.slow_queries import SlowQuery, SlowQueryLog
+
+if TYPE_CHECKING:
+    from litestar.connection import ASGIConnection
+    from litestar.handlers import BaseRouteHandler
+    from litestar.types import Guard
+
+
+def bearer_guard(secret: str) -> Guard:
+    """Guard letting through the requests sending ``Authorization: Bearer <secret>``, 401 otherwise."""
+    expected = f"Bearer {secret}".encode()
+
+    def guard(connection: ASGIConnection, _: BaseRouteHandler) -> None:
+        if not hmac.compare_digest(connection.headers.get("authorization", "").encode("latin-1"), expected):
+            raise NotAuthorizedException()
+
+    return guard
+
+
+class AdminController(Controller):
+    """Operational endpoints
+
+    They show SQL text and query plans, the app only installs them guarded by `bearer_guard`,
+    or open in development.
+    """
+
+    path = "/admin"
+    tags = ["Admin"]
+
+    @get(path="/cache")
+    async def get_cache_stats(self, response_cache: ResponseCache) -> dict[str, int]:
+        """
+        ### Response Cache Statistics ###
+        Get the **hit**, **miss** and **eviction** counters of the response cache.
+        """
+        return response_cache.stats()
+
+    @get(path="/compression")
+    async def get_compression_stats(self, compressed_body_cache: ResponseCache) -> dict[str, int]:
+        """
+        ### Compressed Body Cache Statistics ###
+        Get the **hit**, **miss** and **eviction** counters of the cache of compressed response bodies.
+        """
+        return compressed_body_cache.stats()
+
+    @get(path="/slow-queries")
+    async def get_slow_queries(
+        self,
+        slow_query_log: SlowQueryLog,
+        limit: int | None = Parameter(query="limit", ge=1, required=False),
+    ) -> list[SlowQuery]:
+        """
+        ### Slow Queries ###
+        Get the latest statements slower than the threshold (`SLOW_QUERY_MS`, 20 ms by default), most recent first,
+        with their duration, calling route, parameter types and SQLite query plan, e.g. to spot scans of `book`.
+        """
+        return slow_query_log.recent(limit)
@@ -1,31 +1,76 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 from uuid import UUID
 
-from advanced_alchemy import SQLAlchemyAsyncRepository
-from pydantic import TypeAdapter
-
-from litestar import get
+from litestar import Request, get
 from litestar.controller import Controller
-from litestar.di import Provide
 from litestar.handlers.http_handlers.decorators import delete, patch, post, put
 from litestar.pagination import OffsetPagination
 from litestar.params import Parameter
 from litestar.repository.filters import LimitOffset
-from sqlalchemy import select
+from litestar.response import Stream
+from sqlalchemy import Row, func, select
 from sqlalchemy.orm import selectinload
 
+from step5.batch import BatchResult
+from step5.cache import AUTHOR, AUTHOR_WITH_BOOKS, BOOK, ResponseCache
+from step5.common import from_orm
+from step5.compression import SKIP_COMPRESSION_OPT_KEY
+from step5.conditional import Validator, check_not_modified, is_conditional
+from step5.export import ExportFormat, export_response
+from step5.fields import from_orm_fields, provide_fields, variant
 from step5.model.author import AuthorModel, Author, AuthorCreate, AuthorUpdate, AuthorAndBooks
+from step5.model.book import BookModel, BookWithOutAuthor
+from step5.ndjson import ImportResult, import_ndjson
+from step5.pagination import CountMode, Cursor, CursorPagination
+from step5.query_budget import QUERY_BUDGET_OPT_KEY
+from step5.repository import Repository
+from step5.timing import TimedProvide
 
 if TYPE_CHECKING:
-    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+MAX_CACHED_BOOK_PAGES = 16
+"""Pages of books cached per author by `get_author_and_books`, the oldest is dropped first."""
 
 
-class AuthorRepository(SQLAlchemyAsyncRepository[AuthorModel]):
+class AuthorRepository(Repository[AuthorModel]):
     """Author repository."""
 
     model_type = AuthorModel
+    validator_columns = ("id", "name", "dob")
+
+    async def get_books_summary(self, author_id: UUID) -> Row[Any]:
+        """Get the name, dob, book count and latest book update of an author with one aggregate query.
+
+        Everything an author and their books response needs besides the page of books, and
+        what its validator is built from.
+        """
+        statement = (
+            select(
+                AuthorModel.name,
+                AuthorModel.dob,
+                # author_id rather than id, so (author_id, updated_at) covers the query
+                func.count(BookModel.author_id).label("book_count"),
+                func.max(BookModel.updated_at).label("books_updated_at"),
+            )
+            .outerjoin(AuthorModel.books)
+            .where(AuthorModel.id == author_id)
+            .group_by(AuthorModel.id)
+        )
+        return self.check_not_found((await self.session.execute(statement)).one_or_none())
+
+    async def list_books(self, author_id: UUID, limit_offset: LimitOffset) -> list[Row[Any]]:
+        """Get one page of the books of an author in creation order, only the columns of `BookWithOutAuthor`."""
+        statement = (
+            select(BookModel.id, BookModel.title)
+            .where(BookModel.author_id == author_id)
+            .order_by(BookModel.created_at, BookModel.id)
+            .limit(limit_offset.limit)
+            .offset(limit_offset.offset)
+        )
+        return list((await self.session.execute(statement)).all())
 
 
 async def provide_authors_repo(db_session: AsyncSession) -> AuthorRepository:
@@ -44,30 +89,80 @@ async def provide_author_details_repo(db_session: AsyncSession) -> AuthorReposit
 class AuthorController(Controller):
     """Author CRUD"""
 
-    dependencies = {"authors_repo": Provide(provide_authors_repo)}
+    dependencies = {
+        "authors_repo": TimedProvide(provide_authors_repo),
+        "fields": TimedProvide(provide_fields(Author), sync_to_thread=False),
+    }
     path = "/authors"
     tags = ["Author CRUD"]
 
-    @get()
+    # count=estimated on a table not analyzed yet: the page, the sqlite_stat1 lookup and a COUNT
+    @get(opt={QUERY_BUDGET_OPT_KEY: 3})
     async def list_authors(
         self,
+        request: Request,
         authors_repo: AuthorRepository,
         limit_offset: LimitOffset,
+        count_mode: CountMode,
+        fields: list[str] | None,
     ) -> OffsetPagination[Author]:
         """
         ### List authors ###
         List all the **author** records in paginated form with the *total* record count.
+        Use `count=estimated` or `count=none` to skip the full count on large tables,
+        and `fields` to get only some of the fields, e.g. `fields=id,name`.
         """
-        results, total = await authors_repo.list_and_count(limit_offset)
-        type_adapter = TypeAdapter(list[Author])
+        authors_repo.load_fields(fields)
+        results, total = await authors_repo.list_and_count_by_mode(limit_offset, count_mode)
+        page = (total, limit_offset.limit, limit_offset.offset, fields)
+        check_not_modified(request, authors_repo.page_validator(results, *page))
         return OffsetPagination[Author](
-            items=type_adapter.validate_python(results),
+            items=from_orm_fields(results, list[Author], fields),
             total=total,
             limit=limit_offset.limit,
             offset=limit_offset.offset,
         )
 
-    @post()
+    @get(path="/cursor", opt={QUERY_BUDGET_OPT_KEY: 1})
+    async def list_authors_by_cursor(
+        self,
+        request: Request,
+        authors_repo: AuthorRepository,
+        cursor: Cursor,
+        fields: list[str] | None,
+    ) -> CursorPagination[Author]:
+        """
+        ### List authors by cursor ###
+        List all the **author** records one page at a time.
+        Pass the *next_cursor* of a page as `after` to get the following page,
+        the cost of a page stays the same no matter how deep it is.
+        """
+        authors_repo.load_fields(fields)
+        results, next_cursor = await authors_repo.list_after(cursor)
+        check_not_modified(request, authors_repo.page_validator(results, cursor.after, next_cursor, fields))
+        return CursorPagination[Author](
+            items=from_orm_fields(results, list[Author], fields),
+            limit=cursor.limit,
+            next_cursor=next_cursor,
+        )
+
+    @get(path="/batch", opt={QUERY_BUDGET_OPT_KEY: 2})
+    async def get_authors_batch(
+        self,
+        request: Request,
+        authors_repo: AuthorRepository,
+        batch_ids: list[UUID],
+    ) -> BatchResult[Author]:
+        """
+        ### Get Authors By ID ###
+        Get many **authors** at once, repeat `ids` for each one: `?ids=...&ids=...`.
+        They come back in the order asked for, the ids matching no author are listed in *missing*.
+        """
+        results, missing = await authors_repo.get_many(batch_ids)
+        check_not_modified(request, authors_repo.page_validator(results, missing))
+        return BatchResult[Author](items=from_orm(results, list[Author]), missing=missing)
+
+    @post(opt={QUERY_BUDGET_OPT_KEY: 2})
     async def create_author(
         self,
         authors_repo: AuthorRepository,
@@ -91,28 +186,85 @@ class AuthorController(Controller):
             AuthorModel(**data.model_dump(exclude_unset=True, exclude_none=True)),
         )
         await authors_repo.session.commit()
-        return Author.model_validate(obj)
+        return from_orm(obj, Author)
 
-    @get(path="with-books/{author_id:uuid}")
+    @post(path="/import", opt={QUERY_BUDGET_OPT_KEY: None})
+    async def import_authors(
+        self,
+        request: Request,
+        authors_repo: AuthorRepository,
+    ) -> ImportResult:
+        """
+        ### Import Authors ###
+        Stream new **author** records as newline delimited JSON (`application/x-ndjson`), one author per line.
+        Lines are validated as they arrive and committed in batches,
+        invalid lines are reported by line number without stopping the import.
+        ```Example Data:
+        {"name": "John Q Public", "dob": "2020-01-04"}
+        {"name": "Joe Doe"}
+        ```
+        """
+        return await import_ndjson(request, AuthorCreate, authors_repo)
+
+    @get(path="/export", opt={SKIP_COMPRESSION_OPT_KEY: True, QUERY_BUDGET_OPT_KEY: 1})
+    async def export_authors(
+        self,
+        request: Request,
+        db_read_engine: AsyncEngine,
+        fmt: ExportFormat = Parameter(query="format", default=ExportFormat.NDJSON, required=False),
+    ) -> Stream:
+        """
+        ### Export Authors ###
+        Download every **author** as newline delimited JSON, or CSV with `format=csv`.
+        Rows are streamed as they are read, the download starts right away whatever the size of the table.
+        """
+        statement = select(AuthorModel.id, AuthorModel.name, AuthorModel.dob)
+        return export_response(request, db_read_engine, statement, Author, fmt, "authors")
+
+    @get(path="with-books/{author_id:uuid}", opt={QUERY_BUDGET_OPT_KEY: 2})
     async def get_author_and_books(
         self,
+        request: Request,
         authors_repo: AuthorRepository,
+        response_cache: ResponseCache,
+        limit_offset: LimitOffset,
         author_id: UUID = Parameter(
             title="Author ID",
             description="The author to retrieve.",
         ),
+        count_only: bool = Parameter(query="countOnly", default=False, required=False),
     ) -> AuthorAndBooks:
         """
         ### Get Author And Their Books
-        Get an existing **author** with all of their **books**.
+        Get an existing **author** with one page of their **books**, oldest first, and their *book_count*.
+        Use `currentPage` and `pageSize` to page through the books, or `countOnly=true` to get the count alone.
         """
-        obj = await authors_repo.get(author_id)
-        return AuthorAndBooks.model_validate(obj)
+        page = (limit_offset.limit, limit_offset.offset, count_only)
+        # one entry per author holding every cached page, so writing any of those books drops them all
+        cached = response_cache.get((AUTHOR_WITH_BOOKS, author_id))
+        summary, pages = cached if cached is not None else (await authors_repo.get_books_summary(author_id), {})
+        check_not_modified(request, Validator.of(author_id, *summary, *page))
+        if page not in pages:
+            books = None
+            if not count_only:
+                books = from_orm(await authors_repo.list_books(author_id, limit_offset), list[BookWithOutAuthor])
+            if len(pages) >= MAX_CACHED_BOOK_PAGES:
+                del pages[next(iter(pages))]
+            pages[page] = AuthorAndBooks(
+                id=author_id, name=summary.name, dob=summary.dob, book_count=summary.book_count, books=books,
+            )
+            # (AUTHOR_WITH_BOOKS,) drops every author's entry, for a book moving between authors
+            tags = [(AUTHOR_WITH_BOOKS,), *((BOOK, book.id) for entry in pages.values() for book in entry.books or ())]
+            response_cache.set((AUTHOR_WITH_BOOKS, author_id), (summary, pages), tags=tags)
+        return pages[page]
 
-    @get(path="/{author_id:uuid}")
+    @get(path="/{author_id:uuid}", opt={QUERY_BUDGET_OPT_KEY: 2})
     async def get_author(
         self,
+        request: Request,
         authors_repo: AuthorRepository,
+        response_cache: ResponseCache,
+        fields: list[str] | None,
         author_id: UUID = Parameter(
             title="Author ID",
             description="The author to retrieve.",
@@ -120,15 +272,29 @@ class AuthorController(Controller):
     ) -> Author:
         """
         ### Get Author ###
-        Get an existing **author**.
+        Get an existing **author**, or only some of their fields with e.g. `fields=id,name`.
         """
-        obj = await authors_repo.get(author_id)
-        return Author.model_validate(obj)
+        cached = response_cache.get((AUTHOR, author_id))
+        if cached is None:
+            if is_conditional(request):
+                check_not_modified(request, variant(await authors_repo.get_validator(author_id), fields))
+            if fields is not None:
+                # only the full author is cached, a subset is selected and returned as is
+                authors_repo.load_fields(fields)
+                obj = await authors_repo.get(author_id)
+                check_not_modified(request, variant(authors_repo.validator(obj), fields))
+                return from_orm_fields(obj, Author, fields)
+            obj = await authors_repo.get(author_id)
+            cached = response_cache.set((AUTHOR, author_id), (authors_repo.validator(obj), from_orm(obj, Author)))
+        validator, result = cached
+        check_not_modified(request, variant(validator, fields))
+        return result if fields is None else from_orm_fields(result, Author, fields)
 
-    @put(path="/{author_id:uuid}")
+    @put(path="/{author_id:uuid}", opt={QUERY_BUDGET_OPT_KEY: 1})
     async def put_author(
             self,
             authors_repo: AuthorRepository,
+            response_cache: ResponseCache,
             data: AuthorUpdate,
             author_id: UUID = Parameter(
                 title="Author ID",
@@ -149,16 +315,16 @@ class AuthorController(Controller):
         }
         ```
         """
-        raw_obj = data.model_dump(exclude_unset=False, exclude_none=False)
-        raw_obj.update({"id": author_id})
-        obj = await authors_repo.update(AuthorModel(**raw_obj))
+        obj = await authors_repo.update_values(author_id, data.model_dump(exclude_unset=False, exclude_none=False))
         await authors_repo.session.commit()
-        return Author.model_validate(obj)
+        response_cache.invalidate((AUTHOR, author_id), (AUTHOR_WITH_BOOKS, author_id))
+        return from_orm(obj, Author)
 
-    @patch(path="/{author_id:uuid}")
+    @patch(path="/{author_id:uuid}", opt={QUERY_BUDGET_OPT_KEY: 1})
     async def patch_author(
         self,
         authors_repo: AuthorRepository,
+        response_cache: ResponseCache,
         data: AuthorUpdate,
         author_id: UUID = Parameter(
             title="Author ID",
@@ -179,16 +345,16 @@ class AuthorController(Controller):
         }
         ```
         """
-        raw_obj = data.model_dump(exclude_unset=True, exclude_none=True)
-        raw_obj.update({"id": author_id})
-        obj = await authors_repo.update(AuthorModel(**raw_obj))
+        obj = await authors_repo.update_values(author_id, data.model_dump(exclude_unset=True, exclude_none=True))
         await authors_repo.session.commit()
-        return Author.model_validate(obj)
+        response_cache.invalidate((AUTHOR, author_id), (AUTHOR_WITH_BOOKS, author_id))
+        return from_orm(obj, Author)
 
-    @delete(path="/{author_id:uuid}")
+    @delete(path="/{author_id:uuid}", opt={QUERY_BUDGET_OPT_KEY: 2})
     async def delete_author(
         self,
         authors_repo: AuthorRepository,
+        response_cache: ResponseCache,
         author_id: UUID = Parameter(
             title="Author ID",
             description="The author to delete.",
@@ -200,3 +366,4 @@ class AuthorController(Controller):
         """
         _ = await authors_repo.delete(author_id)
         await authors_repo.session.commit()
+        response_cache.invalidate((AUTHOR, author_id), (AUTHOR_WITH_BOOKS, author_id))
@@ -1,29 +1,42 @@
 from __future__ import annotations
 
+from collections.abc import Iterator
 from typing import TYPE_CHECKING
 from uuid import UUID
 
-from advanced_alchemy import SQLAlchemyAsyncRepository
-from pydantic import TypeAdapter
-
-from litestar import get
+from litestar import Request, get
 from litestar.controller import Controller
-from litestar.di import Provide
 from litestar.handlers.http_handlers.decorators import delete, patch, post, put
 from litestar.pagination import OffsetPagination
 from litestar.params import Parameter
 from litestar.repository.filters import LimitOffset
+from litestar.response import Stream
+from sqlalchemy import select
 
-from step5.model.book import BookModel, Book, BookCreate, BookUpdate, BulkBookCreate
+from step5.batch import BatchResult
+from step5.cache import AUTHOR_WITH_BOOKS, BOOK, ResponseCache
+from step5.common import from_orm
+from step5.compression import SKIP_COMPRESSION_OPT_KEY
+from step5.conditional import check_not_modified, is_conditional
+from step5.export import ExportFormat, export_response
+from step5.fields import from_orm_fields, provide_fields, variant
+from step5.model.book import BookModel, Book, BookCreate, BookUpdate, BulkBookCreate, BulkBookResult
+from step5.ndjson import ImportResult, import_ndjson
+from step5.pagination import CountMode, Cursor, CursorPagination
+from step5.query_budget import QUERY_BUDGET_OPT_KEY
+from step5.repository import Repository
+from step5.timing import TimedProvide
 
 if TYPE_CHECKING:
-    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
 
-class BookRepository(SQLAlchemyAsyncRepository[BookModel]):
+class BookRepository(Repository[BookModel]):
     """Author repository."""
 
     model_type = BookModel
+    keyset_columns = ("created_at", "id")
+    validator_columns = ("id", "updated_at")
 
 
 async def provide_book_repo(db_session: AsyncSession) -> BookRepository:
@@ -34,41 +47,92 @@ async def provide_book_repo(db_session: AsyncSession) -> BookRepository:
 class BookController(Controller):
     """Book CRUD"""
 
-    dependencies = {"book_repo": Provide(provide_book_repo)}
+    dependencies = {
+        "book_repo": TimedProvide(provide_book_repo),
+        "fields": TimedProvide(provide_fields(Book), sync_to_thread=False),
+    }
     path = "/book"
     tags = ["Book CRUD"]
 
     class Helper:
         @staticmethod
-        def convert_books(data: BulkBookCreate) -> list[dict[str, UUID]]:
-            # transform the list of strings to a list of BookCreate objects
+        def convert_books(data: BulkBookCreate) -> Iterator[dict[str, str | UUID]]:
+            # transform the list of strings to BookCreate like rows
             # because this is a simple model we can use this one line
             # this is instead of `data.model_dump`
-            return [{"title": title, "author_id": data.author_id} for title in data.title]
+            # a generator, so the rows are only built one insert chunk at a time
+            return ({"title": title, "author_id": data.author_id} for title in data.title)
 
-    @get()
+    # count=estimated on a table not analyzed yet: the page, the sqlite_stat1 lookup and a COUNT
+    @get(opt={QUERY_BUDGET_OPT_KEY: 3})
     async def list_books(
             self,
+            request: Request,
             book_repo: BookRepository,
             limit_offset: LimitOffset,
+            count_mode: CountMode,
+            fields: list[str] | None,
     ) -> OffsetPagination[Book]:
         """
         ### List All ###
         List, **book** records, paginated
+        Use `count=estimated` or `count=none` to skip the full count on large tables,
+        and `fields` to get only some of the fields, e.g. `fields=id,title`.
         """
-        results, total = await book_repo.list_and_count(limit_offset)
-        type_adapter = TypeAdapter(list[Book])
+        book_repo.load_fields(fields)
+        results, total = await book_repo.list_and_count_by_mode(limit_offset, count_mode)
+        page = (total, limit_offset.limit, limit_offset.offset, fields)
+        check_not_modified(request, book_repo.page_validator(results, *page))
         return OffsetPagination[Book](
-            items=type_adapter.validate_python(results),
+            items=from_orm_fields(results, list[Book], fields),
             total=total,
             limit=limit_offset.limit,
             offset=limit_offset.offset,
         )
 
-    @post()
+    @get(path="/cursor", opt={QUERY_BUDGET_OPT_KEY: 1})
+    async def list_books_by_cursor(
+            self,
+            request: Request,
+            book_repo: BookRepository,
+            cursor: Cursor,
+            fields: list[str] | None,
+    ) -> CursorPagination[Book]:
+        """
+        ### List All By Cursor ###
+        List **book** records in creation order, one page at a time.
+        Pass the *next_cursor* of a page as `after` to get the following page.
+        """
+        book_repo.load_fields(fields)
+        results, next_cursor = await book_repo.list_after(cursor)
+        check_not_modified(request, book_repo.page_validator(results, cursor.after, next_cursor, fields))
+        return CursorPagination[Book](
+            items=from_orm_fields(results, list[Book], fields),
+            limit=cursor.limit,
+            next_cursor=next_cursor,
+        )
+
+    @get(path="/batch", opt={QUERY_BUDGET_OPT_KEY: 2})
+    async def get_books_batch(
+            self,
+            request: Request,
+            book_repo: BookRepository,
+            batch_ids: list[UUID],
+    ) -> BatchResult[Book]:
+        """
+        ### Get Books By ID ###
+        Get many **books** at once, repeat `ids` for each one: `?ids=...&ids=...`.
+        They come back in the order asked for, the ids matching no book are listed in *missing*.
+        """
+        results, missing = await book_repo.get_many(batch_ids)
+        check_not_modified(request, book_repo.page_validator(results, missing))
+        return BatchResult[Book](items=from_orm(results, list[Book]), missing=missing)
+
+    @post(opt={QUERY_BUDGET_OPT_KEY: 2})
     async def create_book(
             self,
             book_repo: BookRepository,
+            response_cache: ResponseCache,
             data: BookCreate,
     ) -> Book:
         """
@@ -85,14 +149,22 @@ class BookController(Controller):
             BookModel(**data.model_dump(exclude_unset=True, exclude_none=True)),
         )
         await book_repo.session.commit()
-        return Book.model_validate(obj)
+        response_cache.invalidate((AUTHOR_WITH_BOOKS, obj.author_id))
+        return from_orm(obj, Book)
 
-    @post("/bulk")
+    @post("/bulk", opt={QUERY_BUDGET_OPT_KEY: None})
     async def bulk_create_book(
             self,
             book_repo: BookRepository,
+            response_cache: ResponseCache,
             data: BulkBookCreate,
-    ) -> list[Book]:
+            ids_only: bool = Parameter(
+                query="idsOnly",
+                default=False,
+                required=False,
+                description="Only return the number of books created and their ids.",
+            ),
+    ) -> list[Book] | BulkBookResult:
         """
         ### Bulk Create New Book ###
         Create many new **book** records.
@@ -104,18 +176,65 @@ class BookController(Controller):
           "author_id": "78424c75-5c41-4b25-9735-3c9f7d05c59e"
         }
         ```
+        Use `idsOnly=true` to get `{"count": 3, "ids": [...]}` instead of the books.
         """
         new_data = self.Helper.convert_books(data)
-        obj = await book_repo.add_many(
-            [BookModel(**d) for d in new_data]
-        )
+        if ids_only:
+            rows = await book_repo.insert_many(new_data, BookModel.id)
+            await book_repo.session.commit()
+            response_cache.invalidate((AUTHOR_WITH_BOOKS, data.author_id))
+            return BulkBookResult(count=len(rows), ids=[row.id for row in rows])
+        rows = await book_repo.insert_many(new_data, BookModel.id, BookModel.title, BookModel.author_id)
         await book_repo.session.commit()
-        return [Book.model_validate(o) for o in obj]
+        response_cache.invalidate((AUTHOR_WITH_BOOKS, data.author_id))
+        return from_orm(rows, list[Book])
+
+    @post("/import", opt={QUERY_BUDGET_OPT_KEY: None})
+    async def import_books(
+            self,
+            request: Request,
+            book_repo: BookRepository,
+            response_cache: ResponseCache,
+    ) -> ImportResult:
+        """
+        ### Import Books ###
+        Stream new **book** records as newline delimited JSON (`application/x-ndjson`), one book per line.
+        Lines are validated as they arrive and committed in batches,
+        invalid lines are reported by line number without stopping the import.
+        ```Example Data:
+        {"title": "Book Title 1", "author_id": "78424c75-5c41-4b25-9735-3c9f7d05c59e"}
+        {"title": "Book Title 2", "author_id": "78424c75-5c41-4b25-9735-3c9f7d05c59e"}
+        ```
+        """
+        return await import_ndjson(
+            request,
+            BookCreate,
+            book_repo,
+            on_commit=lambda rows: response_cache.invalidate(*{(AUTHOR_WITH_BOOKS, row["author_id"]) for row in rows}),
+        )
+
+    @get(path="/export", opt={SKIP_COMPRESSION_OPT_KEY: True, QUERY_BUDGET_OPT_KEY: 1})
+    async def export_books(
+            self,
+            request: Request,
+            db_read_engine: AsyncEngine,
+            fmt: ExportFormat = Parameter(query="format", default=ExportFormat.NDJSON, required=False),
+    ) -> Stream:
+        """
+        ### Export Books ###
+        Download every **book** as newline delimited JSON, or CSV with `format=csv`.
+        Rows are streamed as they are read, the download starts right away whatever the size of the table.
+        """
+        statement = select(BookModel.id, BookModel.title, BookModel.author_id)
+        return export_response(request, db_read_engine, statement, Book, fmt, "books")
 
-    @get(path="/{book_id:uuid}")
+    @get(path="/{book_id:uuid}", opt={QUERY_BUDGET_OPT_KEY: 2})
     async def get_book(
             self,
+            request: Request,
             book_repo: BookRepository,
+            response_cache: ResponseCache,
+            fields: list[str] | None,
             book_id: UUID = Parameter(
                 title="Book ID",
                 description="The book to retrieve.",
@@ -123,15 +242,30 @@ class BookController(Controller):
     ) -> Book:
         """
         ### Get Book ###
-        Get an existing **book**.
+        Get an existing **book**, or only some of its fields with e.g. `fields=id,title`.
         """
-        obj = await book_repo.get(book_id)
-        return Book.model_validate(obj)
+        cached = response_cache.get((BOOK, book_id))
+        if cached is None:
+            if is_conditional(request):
+                # revalidate from (id, updated_at) alone, the row is only loaded when it has changed
+                check_not_modified(request, variant(await book_repo.get_validator(book_id), fields))
+            if fields is not None:
+                # only the full book is cached, a subset is selected and returned as is
+                book_repo.load_fields(fields)
+                obj = await book_repo.get(book_id)
+                check_not_modified(request, variant(book_repo.validator(obj), fields))
+                return from_orm_fields(obj, Book, fields)
+            obj = await book_repo.get(book_id)
+            cached = response_cache.set((BOOK, book_id), (book_repo.validator(obj), from_orm(obj, Book)))
+        validator, result = cached
+        check_not_modified(request, variant(validator, fields))
+        return result if fields is None else from_orm_fields(result, Book, fields)
 
-    @put(path="/{book_id:uuid}")
+    @put(path="/{book_id:uuid}", opt={QUERY_BUDGET_OPT_KEY: 1})
     async def put_book(
             self,
             book_repo: BookRepository,
+            response_cache: ResponseCache,
             data: BookUpdate,
             book_id: UUID = Parameter(
                 title="Book ID",
@@ -148,16 +282,17 @@ class BookController(Controller):
         }
         ```
         """
-        raw_obj = data.model_dump(exclude_unset=False, exclude_none=False)
-        raw_obj.update({"id": book_id})
-        obj = await book_repo.update(BookModel(**raw_obj))
+        obj = await book_repo.update_values(book_id, data.model_dump(exclude_unset=False, exclude_none=False))
         await book_repo.session.commit()
-        return Book.model_validate(obj)
+        # the book may have moved and RETURNING only has the new author, drop every author's entry
+        response_cache.invalidate((BOOK, book_id), (AUTHOR_WITH_BOOKS,))
+        return from_orm(obj, Book)
 
-    @patch(path="/{book_id:uuid}")
+    @patch(path="/{book_id:uuid}", opt={QUERY_BUDGET_OPT_KEY: 1})
     async def patch_book(
             self,
             book_repo: BookRepository,
+            response_cache: ResponseCache,
             data: BookUpdate,
             book_id: UUID = Parameter(
                 title="Book ID",
@@ -174,16 +309,18 @@ class BookController(Controller):
         }
         ```
         """
-        raw_obj = data.model_dump(exclude_unset=True, exclude_none=True)
-        raw_obj.update({"id": book_id})
-        obj = await book_repo.update(BookModel(**raw_obj))
+        values = data.model_dump(exclude_unset=True, exclude_none=True)
+        obj = await book_repo.update_values(book_id, values)
         await book_repo.session.commit()
-        return Book.model_validate(obj)
+        # author_id is required, the book may have moved and RETURNING only has the new author
+        response_cache.invalidate((BOOK, book_id), (AUTHOR_WITH_BOOKS,))
+        return from_orm(obj, Book)
 
-    @delete(path="/{book_id:uuid}")
+    @delete(path="/{book_id:uuid}", opt={QUERY_BUDGET_OPT_KEY: 2})
     async def delete_book(
             self,
             book_repo: BookRepository,
+            response_cache: ResponseCache,
             book_id: UUID = Parameter(
                 title="Book ID",
                 description="The book to delete.",
@@ -193,5 +330,6 @@ class BookController(Controller):
         ### Delete Book ###
         Delete a **book** from the system.
         """
-        _ = await book_repo.delete(book_id)
+        obj = await book_repo.delete(book_id)
         await book_repo.session.commit()
+        response_cache.invalidate((BOOK, book_id), (AUTHOR_WITH_BOOKS, obj.author_id))
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import os
+from dataclasses import asdict, dataclass, replace
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+PROFILE_ENV_VAR = "DB_PROFILE"
+DEFAULT_PROFILE = "production"
+READ_POOL_SIZE = 4
+
+
+@dataclass(frozen=True)
+class SQLiteProfile:
+    """PRAGMAs applied to every new SQLite connection."""
+
+    journal_mode: str = "WAL"
+    """WAL lets readers carry on while a write is in progress."""
+    synchronous: str = "NORMAL"
+    """Safe with WAL, a power loss can only lose the last transactions."""
+    mmap_size: int = 256 * 1024 * 1024
+    """Bytes of the database file read through memory mapping."""
+    cache_size: int = -64 * 1024
+    """Page cache of each connection, in pages when positive and KiB when negative."""
+    temp_store: str = "MEMORY"
+    busy_timeout: int = 5_000
+    """Milliseconds to wait for a lock before failing with "database is locked"."""
+    query_only: bool = False
+    """Reject every write, set on the connections of the read-only pool."""
+
+
+PROFILES = {
+    # SQLite's own settings, what the app used before the profiles (Python's sqlite3 waits 5s for locks)
+    "rollback": SQLiteProfile(
+        journal_mode="DELETE", synchronous="FULL", mmap_size=0, cache_size=-2_000, temp_store="DEFAULT",
+    ),
+    "development": SQLiteProfile(mmap_size=0, cache_size=-16 * 1024),
+    "production": SQLiteProfile(),
+}
+
+
+def get_profile(name: str | None = None) -> SQLiteProfile:
+    """Get the profile called `name`, by default the one named by the `DB_PROFILE` environment variable."""
+    name = name or os.environ.get(PROFILE_ENV_VAR, DEFAULT_PROFILE)
+    try:
+        return PROFILES[name]
+    except KeyError:
+        msg = f"Unknown {PROFILE_ENV_VAR} {name!r}, expected one of: {', '.join(PROFILES)}"
+        raise ValueError(msg) from None
+
+
+def build_read_engine(url: str, profile: SQLiteProfile, pool_size: int = READ_POOL_SIZE) -> AsyncEngine:
+    """Create the engine of the read-only sessions, `pool_size` connections opened with ``query_only``."""
+    return build_engine(url, replace(profile, query_only=True), poolclass=AsyncAdaptedQueuePool, pool_size=pool_size)
+
+
+def build_write_engine(url: str, profile: SQLiteProfile) -> AsyncEngine:
+    """Create the engine of the read-write sessions, one connection so writes queue in the pool.
+
+    SQLite lets one transaction write at a time anyway, waiting for the pool is cheaper than
+    waiting for the lock through `busy_timeout`.
+    """
+    return build_engine(url, profile, poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0)
+
+
+def build_engine(url: str, profile: SQLiteProfile | None = None, **kwargs: Any) -> AsyncEngine:
+    """Create an async engine applying `profile` to each SQLite connection it opens."""
+    engine = create_async_engine(url, **kwargs)
+    if profile is not None and engine.dialect.name == "sqlite":
+        pragmas = asdict(profile)
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def apply_pragmas(dbapi_connection: Any, _: Any) -> None:
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return engine
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import csv
+import io
+import zlib
+from collections.abc import AsyncIterator
+from enum import Enum
+from typing import TYPE_CHECKING, Any
+
+import brotli
+import msgspec
+from litestar.response import Stream
+
+from step5.common import from_orm
+from step5.compression import pick_encoding
+
+if TYPE_CHECKING:
+    from litestar import Request
+    from sqlalchemy import Select
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+PARTITION_SIZE = 1_000
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+_encoder = msgspec.json.Encoder()
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+MEDIA_TYPES = {ExportFormat.NDJSON: "application/x-ndjson", ExportFormat.CSV: "text/csv; charset=utf-8"}
+
+
+async def _encode(engine: AsyncEngine, statement: Select[Any], schema: type[Any], fmt: ExportFormat) -> AsyncIterator[bytes]:
+    """Stream the rows selected by `statement` one partition at a time, encoded as `fmt`."""
+    async with engine.connect() as conn:
+        result = await conn.stream(statement.execution_options(yield_per=PARTITION_SIZE))
+        if fmt is ExportFormat.CSV:
+            yield (",".join(result.keys()) + "\r\n").encode()
+        async for rows in result.partitions():
+            if fmt is ExportFormat.NDJSON:
+                yield _encoder.encode_lines(from_orm(rows, list[schema]))
+            else:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(["" if value is None else value for value in row] for row in rows)
+                yield buffer.getvalue().encode()
+
+
+async def _compress(chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    """Compress a stream chunk by chunk, flushing after each one so the client is never kept waiting."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        async for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        async for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def export_response(
+        request: Request,
+        engine: AsyncEngine,
+        statement: Select[Any],
+        schema: type[Any],
+        fmt: ExportFormat,
+        filename: str,
+) -> Stream:
+    """Build a chunked response streaming every row selected by `statement`.
+
+    Rows are read through a server side cursor on a connection of its own, the request's
+    `db_session` is already closed once the body is being sent. The body is compressed here,
+    one partition at a time, so handlers using this need ``opt={SKIP_COMPRESSION_OPT_KEY: True}``.
+
+    Args:
+        request: The export request, its `Accept-Encoding` picks Brotli, gzip or no compression.
+        engine: Engine to read the rows with.
+        statement: Core select of the exported columns, named like the fields of `schema`.
+        schema: Struct each NDJSON line is encoded from.
+        fmt: NDJSON or CSV.
+        filename: Name offered to the client for the download, without extension.
+    """
+    content = _encode(engine, statement, schema, fmt)
+    headers = {"content-disposition": f'attachment; filename="{filename}.{fmt.value}"', "vary": "Accept-Encoding"}
+    if encoding := pick_encoding(request.headers.get("accept-encoding", ""), ("br", "gzip")):
+        content = _compress(content, encoding)
+        headers["content-encoding"] = encoding
+    return Stream(content, media_type=MEDIA_TYPES[fmt], headers=headers)
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable
+
+import msgspec
+from litestar.params import Parameter
+
+from step5.common import from_orm
+
+if TYPE_CHECKING:
+    from step5.conditional import Validator
+
+
+def provide_fields(schema: type[msgspec.Struct]) -> Callable[..., list[str] | None]:
+    """Build the provider of a `fields` query parameter validated against the fields of `schema`.
+
+    Return type consumed by `Repository.load_fields()` and `from_orm_fields()`.
+    """
+    names = [field.name for field in msgspec.structs.fields(schema)]
+    name = "|".join(names)
+
+    def provide(
+            field_names: str | None = Parameter(
+                query="fields",
+                default=None,
+                required=False,
+                pattern=rf"^({name})(,({name}))*$",
+                description=f"Comma separated fields to return, any of `{','.join(names)}`. All of them by default.",
+            ),
+    ) -> list[str] | None:
+        return None if field_names is None else list(dict.fromkeys(field_names.split(",")))
+
+    return provide
+
+
+def from_orm_fields(obj: Any, schema: Any, fields: list[str] | None) -> Any:
+    """Convert like `from_orm()`, or to dicts of the attributes in `fields` alone when given."""
+    if fields is None:
+        return from_orm(obj, schema)
+    if isinstance(obj, list):
+        return [{name: getattr(item, name) for name in fields} for item in obj]
+    return {name: getattr(obj, name) for name in fields}
+
+
+def variant(validator: Validator, fields: list[str] | None) -> Validator:
+    """Get the validator of the response limited to `fields`, each subset has an ETag of its own."""
+    return validator if fields is None else validator.variant(fields)
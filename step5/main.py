@@ -1,17 +1,53 @@
 from __future__ import annotations
 
-from litestar import Litestar
-from litestar.config.compression import CompressionConfig
-from litestar.contrib.sqlalchemy.base import UUIDBase
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from litestar import Litestar, Request
 from litestar.contrib.sqlalchemy.plugins import AsyncSessionConfig, SQLAlchemyAsyncConfig, SQLAlchemyInitPlugin
-from litestar.di import Provide
-from litestar.openapi import OpenAPIController, OpenAPIConfig
+from litestar.logging import LoggingConfig
+from litestar.middleware import DefineMiddleware
+from litestar.openapi import OpenAPIConfig
 from litestar.params import Parameter
 from litestar.repository.filters import LimitOffset
-from litestar.static_files import StaticFilesConfig
+from sqlalchemy.exc import SQLAlchemyError
 
+from step5.batch import provide_batch_ids
+from step5.cache import ResponseCache
+from step5.compression import CompressionMiddleware, CompressionSettings
+from step5.conditional import NotModifiedException, not_modified_handler, quiet_not_modified, send_validator_headers
+from step5.controller.admin import AdminController, bearer_guard
 from step5.controller.author import AuthorController
 from step5.controller.book import BookController
+from step5.db import build_read_engine, build_write_engine, get_profile
+from step5.metrics import Metrics, MetricsMiddleware
+from step5.openapi import PrebuiltOpenAPIController, PrebuiltSchema
+from step5.pagination import provide_count_mode, provide_cursor_pagination
+from step5.profiling import (
+    DEFAULT_PROFILE_DIRECTORY, PROFILE_DIRECTORY_ENV_VAR, PROFILE_SECRET_ENV_VAR, ProfilingMiddleware,
+)
+from step5.query_budget import QueryBudgetMiddleware
+from step5.schema import migrate_schema, schema_is_current
+from step5.slow_queries import DEFAULT_THRESHOLD, SLOW_QUERY_ENV_VAR, SlowQueryLog
+from step5.statements import instrument as instrument_statements
+from step5.static import StaticAssets
+from step5.timing import (
+    SERVER_TIMING_ENV_VAR, ServerTimingMiddleware, TimedProvide, TimedPydanticInitPlugin, TimedResponse,
+    instrument as instrument_timing,
+)
+
+if TYPE_CHECKING:
+    from litestar.datastructures import State
+    from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+SAFE_METHODS = frozenset({"GET", "HEAD"})
+ANALYZE_INTERVAL = 600
+"""Seconds between refreshes of the row estimates while a worker runs."""
+
+logger = logging.getLogger(__name__)
 
 
 def provide_limit_offset_pagination(
@@ -37,26 +73,146 @@ def provide_limit_offset_pagination(
     return LimitOffset(page_size, page_size * (current_page - 1))
 
 
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite+aiosqlite:///test.sqlite")
+# PRAGMAs come from the profile named by the DB_PROFILE environment variable, see db.py
+profile = get_profile()
+# the app mode, LITESTAR_DEBUG=1 also turns on Litestar's debug mode, whichever DB_PROFILE is used
+development = os.environ.get("LITESTAR_DEBUG", "0") == "1"
+profile_secret = os.environ.get(PROFILE_SECRET_ENV_VAR)
 session_config = AsyncSessionConfig(expire_on_commit=False)
 sqlalchemy_config = SQLAlchemyAsyncConfig(
-    connection_string="sqlite+aiosqlite:///test.sqlite", session_config=session_config
-)  # Create 'db_session' dependency.
+    engine_instance=build_write_engine(DATABASE_URL, profile),
+    session_config=session_config,
+    session_dependency_key="db_write_session",
+)
+read_sqlalchemy_config = SQLAlchemyAsyncConfig(
+    engine_instance=build_read_engine(DATABASE_URL, profile),
+    session_config=AsyncSessionConfig(expire_on_commit=False, autoflush=False),
+    engine_dependency_key="db_read_engine",
+    engine_app_state_key="db_read_engine",
+    session_dependency_key="db_read_session",
+    session_maker_app_state_key="read_session_maker_class",
+)
 sqlalchemy_plugin = SQLAlchemyInitPlugin(config=sqlalchemy_config)
+# plans are read on the read-only pool, the single writer connection stays free
+slow_query_log = SlowQueryLog(
+    threshold=float(os.environ.get(SLOW_QUERY_ENV_VAR, DEFAULT_THRESHOLD * 1000)) / 1000,
+    explain_engine=read_sqlalchemy_config.get_engine(),
+)
+# counted once per request for the metrics, query budgets and Server-Timing, all timed for the slow query log
+instrument_statements(sqlalchemy_config.get_engine(), slow_query_log.observe)
+instrument_statements(read_sqlalchemy_config.get_engine(), slow_query_log.observe)
+# exported at /metrics
+metrics = Metrics()
+# on unless SERVER_TIMING=0, the hooks do nothing without the middleware
+server_timing = os.environ.get(SERVER_TIMING_ENV_VAR, "1") != "0"
+instrument_timing()
+read_sqlalchemy_plugin = SQLAlchemyInitPlugin(config=read_sqlalchemy_config)
+
+
+def provide_db_session(request: Request, state: State) -> AsyncSession:
+    """This provides the 'db_session' dependency, read-only for safe methods.
+
+    GET and HEAD handlers get a session of the read-only pool, which is never committed,
+    the other methods share the single writer connection.
+    """
+    config = read_sqlalchemy_config if request.method in SAFE_METHODS else sqlalchemy_config
+    return config.provide_session(state, request.scope)
+
+
+response_cache = ResponseCache(max_size=1024, ttl=60)
+# compressed bodies are keyed by a hash of the body, they never go stale
+compression_settings = CompressionSettings()
+compressed_body_cache = ResponseCache(max_size=256, ttl=3600)
+
+
+async def provide_response_cache() -> ResponseCache:
+    """This provides the cache shared by the single entity GET handlers."""
+    return response_cache
+
+
+async def provide_compressed_body_cache() -> ResponseCache:
+    """This provides the cache of compressed response bodies, for its statistics."""
+    return compressed_body_cache
 
 
-async def on_startup() -> None:
-    """Initializes the database."""
+async def provide_slow_query_log() -> SlowQueryLog:
+    """This provides the log of slow statements."""
+    return slow_query_log
+
+
+async def analyze(conn: AsyncConnection) -> None:
+    """Refresh the row estimates used by `count=estimated`, bounded so it stays cheap on big tables."""
+    if conn.dialect.name == "sqlite":
+        await conn.exec_driver_sql("PRAGMA analysis_limit=1000")
+        await conn.exec_driver_sql("ANALYZE")
+
+
+async def refresh_estimates() -> None:
+    """Refresh the row estimates every `ANALYZE_INTERVAL` seconds, until cancelled at shutdown."""
+    while True:
+        await asyncio.sleep(ANALYZE_INTERVAL)
+        try:
+            async with sqlalchemy_config.get_engine().begin() as conn:
+                await analyze(conn)
+        except SQLAlchemyError:  # e.g. the database locked by a long import, try again next time
+            logger.warning("Refreshing the row estimates failed", exc_info=True)
+
+
+async def on_startup(app: Litestar) -> None:
+    """Initializes the database when its schema is not current and loads the prebuilt OpenAPI documents."""
+    openapi_schema.load()
+    app.state.refresh_estimates = asyncio.create_task(refresh_estimates())
+    engine = sqlalchemy_config.get_engine()
+    async with engine.connect() as conn:
+        if await conn.run_sync(schema_is_current):
+            return
+    async with engine.begin() as conn:
+        await conn.run_sync(migrate_schema)
+        await analyze(conn)
+
+
+async def on_shutdown(app: Litestar) -> None:
+    """Refreshes the row estimates, once the worker no longer serves requests rather than at startup.
+
+    In between they are refreshed every `ANALYZE_INTERVAL` seconds, not only as of the last restart.
+    """
+    app.state.refresh_estimates.cancel()
     async with sqlalchemy_config.get_engine().begin() as conn:
-        await conn.run_sync(UUIDBase.metadata.create_all)
+        await analyze(conn)
+
+
+# read and precompressed once, served with immutable caching at content hashed URLs
+static_assets = StaticAssets(path='static-files', directory=Path(__file__).parent / 'static-files')
+# built by `python -m step5.openapi`, generated on the first request instead in development
+openapi_schema = PrebuiltSchema(lazy=development)
+
+
+# Litestar's default, without the traceback debug mode logs for every 304
+logging_config = LoggingConfig()
+if (exception_logging_handler := logging_config.exception_logging_handler) is not None:
+    logging_config.exception_logging_handler = quiet_not_modified(exception_logging_handler)
+
+
+class OpenAPIControllerExtra(PrebuiltOpenAPIController):
+    favicon_url = static_assets.url_for('favicon.ico')
+    prebuilt_schema = openapi_schema
+
+
+class AdminControllerExtra(AdminController):
+    # the profiling secret is the bearer token, outside development
+    guards = [bearer_guard(profile_secret)] if profile_secret and not development else []
 
 
-class OpenAPIControllerExtra(OpenAPIController):
-    favicon_url = '/static-files/favicon.ico'
+# SQL text and query plans, only served in development or behind the profiling secret
+admin_route_handlers = [AdminControllerExtra] if development or profile_secret else []
 
 
 app = Litestar(
-    route_handlers=[AuthorController, BookController],
+    route_handlers=[AuthorController, BookController, *admin_route_handlers, static_assets.route_handler(),
+                    metrics.route_handler()],
     on_startup=[on_startup],
+    on_shutdown=[on_shutdown],
     openapi_config=OpenAPIConfig(
         title='My API', version='1.0.0',
         root_schema_site='elements',  # swagger, elements, redoc, rapidoc
@@ -65,11 +221,36 @@ app = Litestar(
         openapi_controller=OpenAPIControllerExtra,
         use_handler_docstrings=True,
     ),
-    static_files_config=[StaticFilesConfig(
-        path='static-files',
-        directories=['static-files']
-    )],
-    plugins=[SQLAlchemyInitPlugin(config=sqlalchemy_config)],
-    dependencies={"limit_offset": Provide(provide_limit_offset_pagination)},
-    compression_config=CompressionConfig(backend="brotli", brotli_gzip_fallback=True, brotli_quality=5),
+    # validates request bodies like Litestar's default Pydantic plugin, timing it for the Server-Timing header
+    plugins=[sqlalchemy_plugin, read_sqlalchemy_plugin, TimedPydanticInitPlugin()],
+    debug=development,
+    logging_config=logging_config,
+    dependencies={
+        "db_session": TimedProvide(provide_db_session, sync_to_thread=False),
+        "limit_offset": TimedProvide(provide_limit_offset_pagination, sync_to_thread=False),
+        "cursor": TimedProvide(provide_cursor_pagination, sync_to_thread=False),
+        "count_mode": TimedProvide(provide_count_mode, sync_to_thread=False),
+        "batch_ids": TimedProvide(provide_batch_ids, sync_to_thread=False),
+        "response_cache": TimedProvide(provide_response_cache),
+        "compressed_body_cache": TimedProvide(provide_compressed_body_cache),
+        "slow_query_log": TimedProvide(provide_slow_query_log),
+    },
+    # renders response bodies like `Response`, timing it for the Server-Timing header
+    response_class=TimedResponse,
+    exception_handlers={NotModifiedException: not_modified_handler},
+    before_send=[send_validator_headers],
+    middleware=[
+        # only installed with a secret to sign the profile header, see profiling.py
+        *([DefineMiddleware(
+            ProfilingMiddleware,
+            secret=profile_secret,
+            directory=os.environ.get(PROFILE_DIRECTORY_ENV_VAR, DEFAULT_PROFILE_DIRECTORY),
+        )] if profile_secret else []),
+        # outermost otherwise, to see the bytes compression sends
+        DefineMiddleware(MetricsMiddleware, metrics=metrics),
+        *([DefineMiddleware(ServerTimingMiddleware)] if server_timing else []),
+        # a warning in production, an error in development and in `python -m step5.query_budget`
+        DefineMiddleware(QueryBudgetMiddleware, strict=development),
+        DefineMiddleware(CompressionMiddleware, settings=compression_settings, cache=compressed_body_cache),
+    ],
 )
@@ -4,21 +4,21 @@ from datetime import date
 from uuid import UUID
 
 from advanced_alchemy.base import UUIDBase
-from sqlalchemy.orm import Mapped, relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from step5.common import BaseModel
+from step5.common import BaseModel, BaseStruct
 from step5.model.book import BookModel, Book, BookWithOutAuthor
 
 
 class AuthorModel(UUIDBase):
     # we can optionally provide the table name instead of auto-generating it
     __tablename__ = "author"
-    name: Mapped[str]
+    name: Mapped[str] = mapped_column(index=True)
     dob: Mapped[date | None]
     books: Mapped[list[BookModel]] = relationship(back_populates="author", lazy="noload")
 
 
-class Author(BaseModel):
+class Author(BaseStruct):
     id: UUID | None
     name: str
     dob: date | None = None
@@ -34,8 +34,10 @@ class AuthorUpdate(BaseModel):
     dob: date | None = None
 
 
-class AuthorAndBooks(BaseModel):
+class AuthorAndBooks(BaseStruct):
     id: UUID | None
     name: str
     dob: date | None = None
+    book_count: int = 0
     books: list[BookWithOutAuthor] | None = None
+    """One page of the books, ``None`` when only the count was asked for."""
@@ -3,26 +3,34 @@ from __future__ import annotations
 from uuid import UUID
 
 from advanced_alchemy.base import UUIDAuditBase
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from step5.common import BaseModel
+from step5.common import BaseModel, BaseStruct
 
 
 class BookModel(UUIDAuditBase):
     __tablename__ = "book"
+    __table_args__ = (
+        # (created_at, id) is the keyset used for cursor pagination
+        Index("ix_book_created_at_id", "created_at", "id"),
+        # finds the books of an author, and their latest update without reading the rows
+        Index("ix_book_author_id_updated_at", "author_id", "updated_at"),
+        # pages through the books of an author in creation order
+        Index("ix_book_author_id_created_at_id", "author_id", "created_at", "id"),
+    )
     title: Mapped[str]
     author_id: Mapped[UUID] = mapped_column(ForeignKey("author.id"))
     author: Mapped["AuthorModel"] = relationship(lazy="joined")
 
 
-class Book(BaseModel):
+class Book(BaseStruct):
     id: UUID | None
     title: str
     author_id: UUID
 
 
-class BookWithOutAuthor(BaseModel):
+class BookWithOutAuthor(BaseStruct):
     id: UUID | None
     title: str
 
@@ -40,3 +48,8 @@ class BookUpdate(BaseModel):
 class BulkBookCreate(BaseModel):
     title: list[str]
     author_id: UUID
+
+
+class BulkBookResult(BaseStruct):
+    count: int
+    ids: list[UUID]
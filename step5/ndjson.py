@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from collections.abc import AsyncIterator, Callable
+from typing import TYPE_CHECKING, Any
+
+from litestar.exceptions import HTTPException
+from litestar.status_codes import HTTP_415_UNSUPPORTED_MEDIA_TYPE
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+
+from step5.common import BaseStruct
+
+if TYPE_CHECKING:
+    from litestar import Request
+
+    from step5.common import BaseModel
+    from step5.repository import Repository
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+MAX_LINE_LENGTH = 64 * 1024
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportLineError(BaseStruct):
+    line: int
+    detail: str
+
+
+class ImportResult(BaseStruct):
+    imported: int = 0
+    failed: int = 0
+    errors: list[ImportLineError] = []
+    """The first `MAX_REPORTED_ERRORS` failures, `failed` counts all of them."""
+
+    def add_error(self, line: int, detail: str, lines: int = 1) -> None:
+        self.failed += lines
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(ImportLineError(line=line, detail=detail))
+
+
+async def iter_lines(stream: AsyncIterator[bytes], max_length: int = MAX_LINE_LENGTH) -> AsyncIterator[bytes | None]:
+    """Split a byte stream into lines as it arrives, ``None`` stands for a line longer than `max_length`."""
+    buffer = b""
+    too_long = False
+    async for chunk in stream:
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            yield None if too_long or len(line) > max_length else line
+            too_long = False
+        if len(buffer) > max_length:
+            too_long = True
+            buffer = b""
+    if too_long:
+        yield None
+    elif buffer:
+        yield buffer
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, e['loc'])) or 'line'}: {e['msg']}" for e in error.errors())
+
+
+async def import_ndjson(
+        request: Request,
+        schema: type[BaseModel],
+        repo: Repository[Any],
+        on_commit: Callable[[list[dict[str, Any]]], None] | None = None,
+) -> ImportResult:
+    """Validate the NDJSON request body one line at a time and insert it in committed batches.
+
+    Only one line and one batch are held in memory, whatever the size of the upload. Invalid
+    lines and batches the database rejects are reported in the result, the rest is imported.
+
+    Args:
+        request: Request with an `application/x-ndjson` body.
+        schema: Model each line is validated with.
+        repo: Repository the rows are inserted with, batches are `repo.insert_chunk_size` rows.
+        on_commit: Called with the rows of every committed batch.
+    """
+    if request.content_type[0] != NDJSON_MEDIA_TYPE:
+        raise HTTPException(status_code=HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=f"Expected {NDJSON_MEDIA_TYPE}")
+    result = ImportResult()
+    batch: list[dict[str, Any]] = []
+    first_line = last_line = 0
+
+    async def flush() -> None:
+        try:
+            await repo.insert_many(batch)
+            await repo.session.commit()
+        except SQLAlchemyError as e:
+            await repo.session.rollback()
+            detail = f"lines {first_line}-{last_line} not imported: {e.__class__.__name__}"
+            result.add_error(first_line, detail, len(batch))
+        else:
+            result.imported += len(batch)
+            if on_commit is not None:
+                on_commit(batch)
+        batch.clear()
+
+    async for number, line in _enumerate(iter_lines(request.stream())):
+        if line is None:
+            result.add_error(number, f"line longer than {MAX_LINE_LENGTH} bytes")
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = schema.model_validate_json(line).model_dump(exclude_unset=True, exclude_none=True)
+        except ValidationError as e:
+            result.add_error(number, _describe(e))
+            continue
+        if not batch:
+            first_line = number
+        batch.append(row)
+        last_line = number
+        if len(batch) >= repo.insert_chunk_size:
+            await flush()
+    if batch:
+        await flush()
+    return result
+
+
+async def _enumerate(lines: AsyncIterator[bytes | None]) -> AsyncIterator[tuple[int, bytes | None]]:
+    number = 0
+    async for line in lines:
+        number += 1
+        yield number, line
@@ -0,0 +1,159 @@
+"""Prebuilt OpenAPI documents.
+
+Building the schema walks every handler signature and docstring, which made the first ``/docs``
+hit of each worker slow. ``python -m step5.openapi`` writes the JSON and YAML documents at build
+time, workers read and precompress them once at startup. Run it again whenever a handler changes.
+``python -m step5.openapi --check`` instead checks that the documentation pages embed them.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from litestar import Request, Response, get
+from litestar.enums import OpenAPIMediaType
+from litestar.exceptions import ImproperlyConfiguredException, NotFoundException
+from litestar.openapi import OpenAPIController
+from litestar.serialization import decode_json, encode_json
+from yaml import dump as dump_yaml
+
+from step5.compression import SKIP_COMPRESSION_OPT_KEY
+from step5.static import REVALIDATE_CACHE_CONTROL, StaticAsset, asset_response, load_asset
+
+if TYPE_CHECKING:
+    from litestar import Litestar
+    from litestar.openapi.spec import OpenAPI
+
+SCHEMA_DIRECTORY = Path(__file__).parent / "openapi-schema"
+DOCUMENTS = {"openapi.json": OpenAPIMediaType.OPENAPI_JSON, "openapi.yaml": OpenAPIMediaType.OPENAPI_YAML}
+
+
+def dump_schema(schema: OpenAPI) -> dict[str, bytes]:
+    """Encode `schema` as each of `DOCUMENTS`."""
+    json_schema = encode_json(schema.to_schema())
+    return {
+        "openapi.json": json_schema,
+        "openapi.yaml": dump_yaml(decode_json(json_schema), default_flow_style=False).encode(),
+    }
+
+
+class PrebuiltSchema:
+    """The OpenAPI documents written by ``python -m step5.openapi``, held in memory.
+
+    With `lazy` the documents are instead generated from the app on the first request, so they
+    never go stale while developing.
+    """
+
+    def __init__(self, directory: str | Path = SCHEMA_DIRECTORY, lazy: bool = False) -> None:
+        self.directory = Path(directory)
+        self.lazy = lazy
+        self._assets: dict[str, StaticAsset] = {}
+
+    def load(self) -> None:
+        """Read and precompress the documents, call once at startup."""
+        if self.lazy:
+            return
+        for name, media_type in DOCUMENTS.items():
+            file = self.directory / name
+            if not file.is_file():
+                raise ImproperlyConfiguredException(
+                    f"{file} is missing, build it with `python -m step5.openapi` or set LITESTAR_DEBUG=1")
+            mtime = datetime.fromtimestamp(file.stat().st_mtime, tz=timezone.utc)
+            self._assets[name] = load_asset(name, file.read_bytes(), media_type, mtime)
+
+    def write(self, app: Litestar) -> list[Path]:
+        """Generate the documents of `app` and write them to `directory`."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        written = []
+        for name, body in dump_schema(app.openapi_schema).items():
+            (file := self.directory / name).write_bytes(body)
+            written.append(file)
+        return written
+
+    def asset(self, request: Request, name: str) -> StaticAsset:
+        if name not in self._assets:
+            if not self.lazy:
+                raise ImproperlyConfiguredException("The OpenAPI documents are not loaded, call `load()` at startup")
+            for generated, body in dump_schema(request.app.openapi_schema).items():
+                self._assets[generated] = load_asset(generated, body, DOCUMENTS[generated])
+        return self._assets[name]
+
+
+class PrebuiltOpenAPIController(OpenAPIController):
+    """Serve the documents of `prebuilt_schema` instead of generating them in the worker.
+
+    The documentation pages inlining the schema, Swagger UI and ReDoc, embed the prebuilt JSON
+    document, the others only need the title, taken from the `OpenAPIConfig`.
+    """
+
+    prebuilt_schema: PrebuiltSchema = PrebuiltSchema(lazy=True)
+
+    def get_schema_from_request(self, request: Request[Any, Any, Any]) -> OpenAPI:  # type: ignore[override]
+        if self.prebuilt_schema.lazy:
+            return request.app.openapi_schema
+        return request.app.openapi_config.to_openapi_schema()
+
+    def _get_schema_as_json(self, request: Request[Any, Any, Any]) -> str:
+        return self.prebuilt_schema.asset(request, "openapi.json").bodies[None].decode()
+
+    def _document(self, request: Request[Any, Any, Any], name: str) -> Response[bytes]:
+        if not self.should_serve_endpoint(request):
+            raise NotFoundException()
+        return asset_response(request, self.prebuilt_schema.asset(request, name), REVALIDATE_CACHE_CONTROL)
+
+    @get(
+        path=["/openapi.yaml", "openapi.yml"],
+        include_in_schema=False,
+        sync_to_thread=False,
+        opt={SKIP_COMPRESSION_OPT_KEY: True},
+    )
+    def retrieve_schema_yaml(self, request: Request[Any, Any, Any]) -> Response[bytes]:
+        return self._document(request, "openapi.yaml")
+
+    @get(
+        path="/openapi.json",
+        include_in_schema=False,
+        sync_to_thread=False,
+        opt={SKIP_COMPRESSION_OPT_KEY: True},
+    )
+    def retrieve_schema_json(self, request: Request[Any, Any, Any]) -> Response[bytes]:
+        return self._document(request, "openapi.json")
+
+
+DOCUMENTATION_PAGES = ("/docs/swagger", "/docs/redoc")
+
+
+def check() -> bool:
+    """Check that the pages inlining the schema embed the prebuilt documents, as served without debug."""
+    from litestar.testing import TestClient
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{Path(directory) / 'openapi.sqlite'}"
+        os.environ["LITESTAR_DEBUG"] = "0"
+        from step5.main import app  # after the environment is set, the app mode is read on import
+
+        ok = True
+        with TestClient(app=app) as client:
+            for page in DOCUMENTATION_PAGES:
+                response = client.get(page)
+                embedded = response.status_code == 200 and '"/authors"' in response.text
+                ok = ok and embedded
+                print(f"{page}: {'ok' if embedded else f'NO /authors PATH ({response.status_code})'}")
+    return ok
+
+
+def main() -> None:
+    if sys.argv[1:] == ["--check"]:
+        sys.exit(0 if check() else 1)
+    from step5.main import app, openapi_schema
+
+    for file in openapi_schema.write(app):
+        print(f"wrote {file}")
+
+
+if __name__ == "__main__":
+    main()
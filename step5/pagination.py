@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import base64
+import json
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Generic, TypeVar
+
+from litestar.exceptions import ValidationException
+from litestar.params import Parameter
+
+T = TypeVar("T")
+
+
+@dataclass
+class Cursor:
+    """Data required to add keyset (cursor) pagination to a query."""
+
+    limit: int
+    """Value for ``LIMIT`` clause of query."""
+    after: list[str] | None = None
+    """Decoded key values of the last row already seen by the client."""
+
+
+@dataclass
+class CursorPagination(Generic[T]):
+    """Container for data returned using keyset (cursor) pagination."""
+
+    items: list[T]
+    """List of data being sent as part of the response."""
+    limit: int
+    """Maximal number of items to send."""
+    next_cursor: str | None
+    """Opaque token to send back as ``after`` for the next page, ``None`` on the last page."""
+
+
+class CountMode(str, Enum):
+    """How the *total* of an offset paginated list is worked out."""
+
+    EXACT = "exact"
+    """Run a full ``COUNT(*)`` over the table."""
+    ESTIMATED = "estimated"
+    """Read the row count SQLite keeps in ``sqlite_stat1``, it is as fresh as the last ``ANALYZE``."""
+    NONE = "none"
+    """Skip counting, *total* only says whether there is at least one more row after the page."""
+
+
+def encode_cursor(values: list[Any]) -> str:
+    """Build an opaque cursor token out of the key values of a row."""
+    raw = json.dumps([v.isoformat() if hasattr(v, "isoformat") else str(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> list[str]:
+    """Turn a cursor token back into the raw key values it was built from."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError as e:
+        raise ValidationException(detail="Invalid cursor") from e
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        raise ValidationException(detail="Invalid cursor")
+    return values
+
+
+def provide_cursor_pagination(
+        after: str | None = Parameter(query="after", default=None, required=False),
+        page_size: int = Parameter(
+            query="pageSize",
+            ge=1,
+            default=10,
+            required=False,
+        ),
+) -> Cursor:
+    """Add keyset (cursor) pagination.
+
+    Return type consumed by `Repository.list_after()`.
+
+    Parameters
+    ----------
+    after : str | None
+        Cursor returned as `next_cursor` by the previous page.
+    page_size : int
+        LIMIT to apply to select.
+    """
+    return Cursor(limit=page_size, after=decode_cursor(after) if after else None)
+
+
+def provide_count_mode(
+        count: CountMode = Parameter(query="count", default=CountMode.EXACT, required=False),
+) -> CountMode:
+    """Choose how the *total* of a paginated list is calculated.
+
+    Return type consumed by `Repository.list_and_count_by_mode()`.
+
+    Parameters
+    ----------
+    count : CountMode
+        `exact`, `estimated` or `none`.
+    """
+    return count
@@ -0,0 +1,124 @@
+"""Profile a single request on demand, asked for with a signed header.
+
+With ``PROFILE_SECRET`` set, a request carrying ``X-Profile: <timestamp>:<signature>`` runs
+under `cProfile`, through the middleware, dependency providers, handler and serialization,
+and the stats are written to ``PROFILE_DIRECTORY`` as a ``.pstats`` file, named in the
+``X-Profile-File`` response header. snakeviz, tuna or flameprof render them as flame graphs,
+``python -m pstats`` reads them too. `cProfile` sees the whole thread, so what the worker runs
+for other requests meanwhile shows up as well.
+
+The signature is an HMAC of the timestamp, method and path, valid for `MAX_AGE` seconds, so a
+header leaked in a log cannot be replayed against other routes or later on. Without the secret
+the middleware is not installed at all. ``python -m step5.profiling GET /authors`` prints a header.
+"""
+from __future__ import annotations
+
+import argparse
+import cProfile
+import hashlib
+import hmac
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from litestar.datastructures import MutableScopeHeaders
+from litestar.enums import ScopeType
+from litestar.middleware import AbstractMiddleware
+
+if TYPE_CHECKING:
+    from litestar.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILE_SECRET_ENV_VAR = "PROFILE_SECRET"
+PROFILE_DIRECTORY_ENV_VAR = "PROFILE_DIRECTORY"
+DEFAULT_PROFILE_DIRECTORY = Path(tempfile.gettempdir()) / "step5-profiles"
+PROFILE_HEADER = "x-profile"
+PROFILE_FILE_HEADER = "x-profile-file"
+MAX_AGE = 300
+"""Seconds a signed header stays valid."""
+
+_header_key = PROFILE_HEADER.encode()
+# one profiler per process, a second one would replace the first's hook
+_profiling = False
+
+
+def sign(secret: str, method: str, path: str, timestamp: int | None = None) -> str:
+    """Build the value of the profile header for a `method` request of `path`."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    message = f"{timestamp} {method.upper()} {path}".encode()
+    return f"{timestamp}:{hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()}"
+
+
+def verify(secret: str, method: str, path: str, value: str) -> bool:
+    """Check that `value` was signed with `secret` for this request, less than `MAX_AGE` seconds ago."""
+    timestamp, _, _ = value.partition(":")
+    if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > MAX_AGE:
+        return False
+    return hmac.compare_digest(value, sign(secret, method, path, int(timestamp)))
+
+
+class ProfilingMiddleware(AbstractMiddleware):
+    """Run the requests carrying a valid profile header under `cProfile`, one at a time.
+
+    A request with an invalid or expired header, or arriving while another one is profiled,
+    is served as usual.
+    """
+
+    scopes = {ScopeType.HTTP}
+
+    def __init__(self, app: ASGIApp, secret: str, directory: str | Path = DEFAULT_PROFILE_DIRECTORY) -> None:
+        super().__init__(app)
+        self.secret = secret
+        self.directory = Path(directory)
+
+    def _requested(self, scope: Scope) -> bool:
+        for key, value in scope["headers"]:
+            if key == _header_key:
+                return verify(self.secret, scope["method"], scope["path"], value.decode("latin-1"))
+        return False
+
+    def file_for(self, scope: Scope) -> Path:
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", scope["path"]).strip("-") or "root"
+        now = datetime.now(timezone.utc)
+        return self.directory / f"{now:%Y%m%dT%H%M%S.%f}-{scope['method']}-{slug[:80]}.pstats"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        global _profiling
+        if _profiling or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        file = self.file_for(scope)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableScopeHeaders.from_message(message)[PROFILE_FILE_HEADER] = file.name
+            await send(message)
+
+        profiler = cProfile.Profile()
+        _profiling = True
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            _profiling = False
+            self.directory.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(file)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Print the header profiling one request.")
+    parser.add_argument("method", help="e.g. GET")
+    parser.add_argument("path", help="e.g. /authors, without the query string")
+    args = parser.parse_args()
+    secret = os.environ.get(PROFILE_SECRET_ENV_VAR)
+    if not secret:
+        parser.error(f"{PROFILE_SECRET_ENV_VAR} is not set")
+    print(f"{PROFILE_HEADER}: {sign(secret, args.method, args.path)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Per request query budgets, and a check that every route keeps within its budget.
+
+A handler declares the statements a request may send with ``opt={QUERY_BUDGET_OPT_KEY: 2}``,
+`DEFAULT_QUERY_BUDGET` otherwise, and ``None`` when the count grows with the input, like the
+batches of an import. `QueryBudgetMiddleware` reads the statements of each request counted by
+`step5.statements` and reports a request over budget, or sending one statement `REPEAT_THRESHOLD`
+times or more with different parameters, the shape of an N+1 query. It logs a warning, or
+raises `QueryBudgetExceeded` in strict mode, which the app uses with ``LITESTAR_DEBUG=1``.
+
+``python -m step5.query_budget`` runs every route of ``step5.benchmark.load_test`` in strict
+mode against a seeded database and checks that every author and book handler declares a
+budget. The database is left unanalyzed, so ``count=estimated`` falls back to a ``COUNT``,
+its worst case. Every statement is logged as slow, and the ``EXPLAIN`` read for the log must
+not count as one of the request's statements. The exit status is 1 when a check fails.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from litestar.enums import HttpMethod, ScopeType
+from litestar.exceptions import InternalServerException
+from litestar.middleware import AbstractMiddleware
+
+from step5.slow_queries import SLOW_QUERY_ENV_VAR
+from step5.statements import track, untrack
+
+if TYPE_CHECKING:
+    from litestar import Litestar
+    from litestar.types import ASGIApp, Message, Receive, Scope, Send
+
+QUERY_BUDGET_OPT_KEY = "query_budget"
+"""Route opt key of the statements a request may send, ``None`` for no limit."""
+DEFAULT_QUERY_BUDGET = 5
+REPEAT_THRESHOLD = 3
+"""Sending one statement this many times in a request is reported as a likely N+1 query."""
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(InternalServerException):
+    """A request sent more statements than its handler's budget, or repeated one."""
+
+
+def problems(statements: dict[str, int], budget: int) -> list[str]:
+    """Describe how `statements` break `budget`, empty when they do not."""
+    found = []
+    if (sent := sum(statements.values())) > budget:
+        found.append(f"{sent} statements sent, the budget is {budget}")
+    for statement, count in statements.items():
+        if count >= REPEAT_THRESHOLD:
+            found.append(f"sent {count} times, likely an N+1 query: {' '.join(statement.split())[:160]}")
+    return found
+
+
+class QueryBudgetMiddleware(AbstractMiddleware):
+    """Report the requests going over the query budget of their handler.
+
+    The statements are checked when the response starts. In `strict` mode a request over budget
+    then fails with `QueryBudgetExceeded` instead. The write handlers have already committed by
+    then, so a write failing its budget is still persisted. Statements sent while the body streams
+    can only be logged.
+    """
+
+    scopes = {ScopeType.HTTP}
+
+    def __init__(self, app: ASGIApp, strict: bool = False, default_budget: int | None = DEFAULT_QUERY_BUDGET) -> None:
+        super().__init__(app)
+        self.strict = strict
+        self.default_budget = default_budget
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        budget = scope["route_handler"].opt.get(QUERY_BUDGET_OPT_KEY, self.default_budget)
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+        reported = False
+
+        def report() -> None:
+            nonlocal reported
+            if not reported and (found := problems(statements.sent, budget)):
+                reported = True
+                message = f"{scope['method']} {scope['path']} is over its query budget: {'; '.join(found)}"
+                if self.strict:
+                    logger.error(message)
+                    raise QueryBudgetExceeded()
+                logger.warning(message)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                report()
+            await send(message)
+
+        statements, token = track()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            untrack(token)
+        if not reported and (found := problems(statements.sent, budget)):
+            logger.warning(f"{scope['method']} {scope['path']} went over its query budget while streaming: "
+                           f"{'; '.join(found)}")
+
+
+class Reports(logging.Handler):
+    """Keep the messages logged by the middleware."""
+
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.messages: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+def undeclared(app: Litestar) -> list[str]:
+    """The author and book handlers of `app` that do not declare a query budget."""
+    from step5.controller.author import AuthorController
+    from step5.controller.book import BookController
+
+    missing = []
+    for route in app.routes:
+        for handler in getattr(route, "route_handlers", ()):
+            if handler.http_methods == {HttpMethod.OPTIONS} or QUERY_BUDGET_OPT_KEY in handler.opt:
+                continue
+            if isinstance(handler.owner, (AuthorController, BookController)):
+                missing.append(f"{'/'.join(sorted(handler.http_methods))} {route.path_format}")
+    return missing
+
+
+async def explained_apart() -> bool:
+    """Whether the plans the slow query log reads are left out of the statements of the request."""
+    from step5.main import read_sqlalchemy_config, slow_query_log
+
+    statements, token = track()
+    try:
+        async with read_sqlalchemy_config.get_engine().connect() as conn:
+            await conn.exec_driver_sql("SELECT count(*) FROM author WHERE name != ?", ("query budget",))
+        await slow_query_log.wait()
+    finally:
+        untrack(token)
+    return statements.count == 1 and slow_query_log.recent(1)[0].plan is not None
+
+
+async def check() -> bool:
+    from litestar.testing import AsyncTestClient
+
+    from step5.benchmark.load_test import READS, WRITES, Context, seed_database
+    from step5.db import build_engine
+
+    url = os.environ["DATABASE_URL"]
+    author_ids, book_ids = await seed_database(url, authors=50, books_per_author=20)
+    engine = build_engine(url)
+    async with engine.begin() as conn:  # the row estimates of a database never analyzed yet
+        await conn.exec_driver_sql("DELETE FROM sqlite_stat1")
+    await engine.dispose()
+    from step5.main import app  # after DATABASE_URL is set, the engines are built on import
+
+    ok = True
+    for handler in undeclared(app):
+        ok = False
+        print(f"{handler}: NO QUERY BUDGET")
+    reports = Reports()
+    logger.addHandler(reports)
+    try:
+        async with AsyncTestClient(app=app) as client:
+            ctx = Context(client, author_ids, book_ids)
+            for name, scenario in {**READS, **WRITES}.items():
+                reports.messages.clear()
+                try:
+                    await scenario(ctx)
+                except RuntimeError as exc:  # an error response, the failed budget is in the reports
+                    reports.messages.append(str(exc))
+                ok = ok and not reports.messages
+                print(f"{name}: {'OVER BUDGET' if reports.messages else 'ok'}")
+                for message in reports.messages:
+                    print(f"    {message}")
+    finally:
+        logger.removeHandler(reports)
+    apart = await explained_apart()
+    print(f"slow query plans: {'ok' if apart else 'COUNTED AS STATEMENTS OF THE REQUEST'}")
+    return ok and apart
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{Path(directory) / 'query_budget.sqlite'}"
+        os.environ["LITESTAR_DEBUG"] = "1"  # strict budgets
+        os.environ[SLOW_QUERY_ENV_VAR] = "0"  # every statement logged with its plan
+        ok = asyncio.run(check())
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
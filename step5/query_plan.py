@@ -0,0 +1,171 @@
+"""Check the SQLite query plan of every repository query the controllers run.
+
+Each scenario below makes the same repository call as a route handler against a seeded
+database. Every statement it sends is run again through ``EXPLAIN QUERY PLAN`` and a full
+scan of ``author`` or ``book`` fails the check, unless the scenario reads the whole table
+by design and says why in ``ALLOWED_SCANS``. Scenarios listed in ``STATEMENT_COUNTS`` must
+also send exactly that many statements.
+
+Run with ``python -m step5.query_plan``, the exit status is 1 when a check fails.
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+import sys
+from collections.abc import Awaitable, Callable
+from typing import TYPE_CHECKING, Any
+from uuid import uuid4
+
+from advanced_alchemy.filters import LimitOffset
+from sqlalchemy import event, select
+
+from step5.benchmark.common import seed, temporary_database
+from step5.controller.author import AuthorRepository
+from step5.controller.book import BookRepository
+from step5.model.author import AuthorModel
+from step5.model.book import BookModel
+from step5.pagination import CountMode, Cursor, decode_cursor
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Connection
+    from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+FULL_SCAN = re.compile(r"^SCAN (author|book)(_\d+)?\b(?!.* USING )")
+"""A table scan, ``SCAN book USING [COVERING] INDEX ...`` walks an index instead."""
+
+Scenario = Callable[["AsyncSession", dict[str, Any]], Awaitable[Any]]
+
+ALLOWED_SCANS = {
+    "list_authors count=exact": "COUNT over the whole table is what count=exact asks for",
+    "list_books count=exact": "COUNT over the whole table is what count=exact asks for",
+    "list_authors count=estimated": "LIMIT/OFFSET pages walk the table, /authors/cursor is the indexed alternative",
+    "list_authors count=none": "LIMIT/OFFSET pages walk the table, /authors/cursor is the indexed alternative",
+    "list_books count=estimated": "LIMIT/OFFSET pages walk the table, /book/cursor is the indexed alternative",
+    "list_books count=none": "LIMIT/OFFSET pages walk the table, /book/cursor is the indexed alternative",
+    "export_authors": "exports read every row",
+    "export_books": "exports read every row",
+}
+
+STATEMENT_COUNTS = {
+    "get_book fields=title": 1,
+    "get_authors_batch": 1,
+    "get_books_batch": 1,
+    "put_book": 1,
+    "patch_book": 1,
+    "put_author": 1,
+    "patch_author": 1,
+    "patch_author {}": 1,
+}
+"""Exact number of statements a scenario may send, for the paths built to save round trips."""
+
+
+async def _second_page(repo: AuthorRepository | BookRepository) -> Any:
+    _, token = await repo.list_after(Cursor(limit=10))
+    return await repo.list_after(Cursor(limit=10, after=decode_cursor(token)))
+
+
+async def _get_fields(repo: AuthorRepository | BookRepository, item_id: Any, fields: list[str]) -> Any:
+    repo.load_fields(fields)
+    return await repo.get(item_id)
+
+
+SCENARIOS: dict[str, Scenario] = {
+    "list_authors count=exact": lambda s, ids: AuthorRepository(session=s).list_and_count_by_mode(
+        LimitOffset(10, 20), CountMode.EXACT),
+    "list_authors count=estimated": lambda s, ids: AuthorRepository(session=s).list_and_count_by_mode(
+        LimitOffset(10, 20), CountMode.ESTIMATED),
+    "list_authors count=none": lambda s, ids: AuthorRepository(session=s).list_and_count_by_mode(
+        LimitOffset(10, 20), CountMode.NONE),
+    "list_books count=exact": lambda s, ids: BookRepository(session=s).list_and_count_by_mode(
+        LimitOffset(10, 20), CountMode.EXACT),
+    "list_books count=estimated": lambda s, ids: BookRepository(session=s).list_and_count_by_mode(
+        LimitOffset(10, 20), CountMode.ESTIMATED),
+    "list_books count=none": lambda s, ids: BookRepository(session=s).list_and_count_by_mode(
+        LimitOffset(10, 20), CountMode.NONE),
+    "list_authors_by_cursor": lambda s, ids: AuthorRepository(session=s).list_after(Cursor(limit=10)),
+    "list_authors_by_cursor next page": lambda s, ids: _second_page(AuthorRepository(session=s)),
+    "list_books_by_cursor": lambda s, ids: BookRepository(session=s).list_after(Cursor(limit=10)),
+    "list_books_by_cursor next page": lambda s, ids: _second_page(BookRepository(session=s)),
+    "get_author": lambda s, ids: AuthorRepository(session=s).get(ids["author"]),
+    "get_author validator": lambda s, ids: AuthorRepository(session=s).get_validator(ids["author"]),
+    "get_author_and_books summary": lambda s, ids: AuthorRepository(session=s).get_books_summary(ids["author"]),
+    "get_author_and_books page": lambda s, ids: AuthorRepository(session=s).list_books(
+        ids["author"], LimitOffset(10, 20)),
+    "get_book": lambda s, ids: BookRepository(session=s).get(ids["book"]),
+    "get_book fields=title": lambda s, ids: _get_fields(BookRepository(session=s), ids["book"], ["title"]),
+    "get_authors_batch": lambda s, ids: AuthorRepository(session=s).get_many([ids["author"], uuid4()]),
+    "get_books_batch": lambda s, ids: BookRepository(session=s).get_many([ids["book"], uuid4()]),
+    "get_book validator": lambda s, ids: BookRepository(session=s).get_validator(ids["book"]),
+    "put_book": lambda s, ids: BookRepository(session=s).update_values(
+        ids["book"], {"title": "new title", "author_id": ids["author"]}),
+    "patch_book": lambda s, ids: BookRepository(session=s).update_values(ids["book"], {"title": "new title"}),
+    "put_author": lambda s, ids: AuthorRepository(session=s).update_values(
+        ids["author"], {"name": "new name", "dob": None}),
+    "patch_author": lambda s, ids: AuthorRepository(session=s).update_values(ids["author"], {"name": "new name"}),
+    "patch_author {}": lambda s, ids: AuthorRepository(session=s).update_values(ids["author"], {}),
+    "delete_book": lambda s, ids: BookRepository(session=s).delete(ids["book"]),
+    "export_authors": lambda s, ids: s.execute(select(AuthorModel.id, AuthorModel.name, AuthorModel.dob)),
+    "export_books": lambda s, ids: s.execute(select(BookModel.id, BookModel.title, BookModel.author_id)),
+}
+
+
+async def explain(conn: AsyncConnection, statement: str, parameters: Any) -> list[str]:
+    """Get the detail lines of the SQLite query plan of `statement`."""
+    result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    return [row[3] for row in result]
+
+
+async def check() -> bool:
+    ok = True
+    async with temporary_database() as (engine, session_maker):
+        author_ids = await seed(engine, authors=50, books_per_author=40)
+        async with session_maker() as session:
+            book_id = (await session.execute(select(BookModel.id).limit(1))).scalar_one()
+        ids = {"author": author_ids[0], "book": book_id}
+        for name, scenario in SCENARIOS.items():
+            statements: list[tuple[str, Any]] = []
+            sent = 0
+
+            def record(
+                conn: Connection, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool,
+            ) -> None:
+                nonlocal sent
+                sent += 1
+                if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    statements.append((statement, parameters))
+
+            event.listen(engine.sync_engine, "before_cursor_execute", record)
+            try:
+                async with session_maker() as session:
+                    await scenario(session, ids)
+                    await session.rollback()
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", record)
+            if name in STATEMENT_COUNTS:
+                expected = STATEMENT_COUNTS[name]
+                status = "ok" if sent == expected else "WRONG STATEMENT COUNT"
+                ok = ok and sent == expected
+                print(f"{name}: {status}, {sent} statement(s) sent, {expected} expected")
+            async with engine.connect() as conn:
+                for statement, parameters in statements:
+                    plan = await explain(conn, statement, parameters)
+                    scans = [line for line in plan if FULL_SCAN.match(line)]
+                    status = "ok"
+                    if scans and name in ALLOWED_SCANS:
+                        status = f"allowed, {ALLOWED_SCANS[name]}"
+                    elif scans:
+                        status = "FULL TABLE SCAN"
+                        ok = False
+                    print(f"{name}: {status}\n    {' '.join(statement.split())[:160]}")
+                    for line in plan:
+                        print(f"      {line}")
+    return ok
+
+
+def main() -> None:
+    sys.exit(0 if asyncio.run(check()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any
+
+from advanced_alchemy import SQLAlchemyAsyncRepository
+from advanced_alchemy.filters import CollectionFilter, LimitOffset, OrderBy
+from advanced_alchemy.repository.typing import ModelT
+from litestar.exceptions import NotFoundException, ValidationException
+from sqlalchemy import Row, insert, lambda_stmt, select, text, tuple_, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import load_only, raiseload
+
+from step5.conditional import Validator
+from step5.pagination import CountMode, Cursor, encode_cursor
+
+
+class Repository(SQLAlchemyAsyncRepository[ModelT]):
+    """Repository with the extra query paths shared by the step5 controllers."""
+
+    keyset_columns: tuple[str, ...] = ("id",)
+    """Ordered, indexed columns used to build pagination cursors. The last one must be unique."""
+    validator_columns: tuple[str, ...] = ("id",)
+    """Columns that change whenever a row changes, used to build ETags."""
+    insert_chunk_size: int = 1_000
+    """Rows sent per executemany by `insert_many()`."""
+    lookup_chunk_size: int = 500
+    """Ids bound per ``IN (...)`` by `get_many()`, well under SQLite's limit of bound parameters."""
+
+    def load_fields(self, fields: list[str] | None) -> None:
+        """Select only the columns of `fields` from now on, and no relationship.
+
+        The id, `keyset_columns` and `validator_columns` are loaded too, the repository needs them.
+        Nothing changes when `fields` is ``None``.
+        """
+        if fields is None:
+            return
+        names = dict.fromkeys([self.id_attribute, *self.keyset_columns, *self.validator_columns, *fields])
+        statement = select(self.model_type).options(
+            load_only(*(getattr(self.model_type, name) for name in names)),
+            raiseload("*"),
+        )
+        self.statement = lambda_stmt(lambda: statement)
+
+    def _make_validator(self, row: tuple[Any, ...]) -> Validator:
+        last_modified = None
+        if "updated_at" in self.validator_columns:
+            last_modified = row[self.validator_columns.index("updated_at")]
+        return Validator.of([row], last_modified=last_modified)
+
+    def _version(self, obj: ModelT) -> tuple[Any, ...]:
+        return tuple(getattr(obj, name) for name in self.validator_columns)
+
+    def validator(self, obj: ModelT) -> Validator:
+        """Build the validator of a loaded record."""
+        return self._make_validator(self._version(obj))
+
+    def page_validator(self, results: list[ModelT], *page: Any) -> Validator:
+        """Build the validator of a page of records, `page` are the values identifying the page.
+
+        Only an ETag: the latest ``updated_at`` of the page does not change when records join or
+        leave it, so a Last-Modified would answer 304 to a page that did change.
+        """
+        return Validator.of(*page, [self._version(obj) for obj in results])
+
+    async def get_validator(self, item_id: Any) -> Validator:
+        """Build the validator of a record by selecting only `validator_columns`, not the whole row.
+
+        Matches `validator()` of the loaded record.
+        """
+        columns = [getattr(self.model_type, name) for name in self.validator_columns]
+        statement = select(*columns).where(getattr(self.model_type, self.id_attribute) == item_id)
+        row = self.check_not_found((await self.session.execute(statement)).one_or_none())
+        return self._make_validator(tuple(row))
+
+    async def get_many(self, item_ids: list[Any]) -> tuple[list[ModelT], list[Any]]:
+        """Get the records of `item_ids` with one ``WHERE id IN (...)`` query per `lookup_chunk_size` ids.
+
+        Returns:
+            The records found, in the order of `item_ids`, and the ids that match no record.
+        """
+        found: dict[Any, ModelT] = {}
+        for start in range(0, len(item_ids), self.lookup_chunk_size):
+            chunk = item_ids[start:start + self.lookup_chunk_size]
+            for obj in await self.list(CollectionFilter(self.id_attribute, chunk)):
+                found[getattr(obj, self.id_attribute)] = obj
+        return [found[i] for i in item_ids if i in found], [i for i in item_ids if i not in found]
+
+    def _parse_keyset(self, values: list[str]) -> list[Any]:
+        if len(values) != len(self.keyset_columns):
+            raise ValidationException(detail="Invalid cursor")
+        parsed = []
+        for name, value in zip(self.keyset_columns, values):
+            python_type = getattr(self.model_type, name).type.python_type
+            try:
+                parsed.append(datetime.fromisoformat(value) if python_type is datetime else python_type(value))
+            except ValueError as e:
+                raise ValidationException(detail="Invalid cursor") from e
+        return parsed
+
+    async def list_after(self, cursor: Cursor) -> tuple[list[ModelT], str | None]:
+        """List the page of records that follows `cursor`, ordered by `keyset_columns`.
+
+        Seeks straight to the first row after the cursor instead of using OFFSET, so
+        the cost of a page does not depend on how deep into the table it is.
+
+        Returns:
+            The records and the cursor for the next page, ``None`` when this is the last one.
+        """
+        filters: list[Any] = [OrderBy(name) for name in self.keyset_columns]
+        if cursor.after is not None:
+            columns = [getattr(self.model_type, name) for name in self.keyset_columns]
+            filters.append(tuple_(*columns) > tuple(self._parse_keyset(cursor.after)))
+        # fetch one extra row to find out whether there is a next page
+        results = await self.list(*filters, LimitOffset(cursor.limit + 1, 0))
+        if len(results) <= cursor.limit:
+            return results, None
+        results = results[:cursor.limit]
+        return results, encode_cursor([getattr(results[-1], name) for name in self.keyset_columns])
+
+    async def estimate_count(self) -> int:
+        """Get the row count of the table from the SQLite planner statistics.
+
+        Falls back to an exact count when the table has not been analyzed or the
+        database is not SQLite.
+        """
+        if self._dialect.name == "sqlite":
+            try:
+                stat = (await self.session.execute(
+                    text("SELECT stat FROM sqlite_stat1 WHERE tbl = :tbl LIMIT 1"),
+                    {"tbl": self.model_type.__tablename__},
+                )).scalar_one_or_none()
+            except OperationalError:  # sqlite_stat1 only exists once ANALYZE has run
+                stat = None
+            if stat:
+                return int(stat.split()[0])
+        return await self.count()
+
+    async def list_and_count_by_mode(
+            self,
+            limit_offset: LimitOffset,
+            count_mode: CountMode,
+    ) -> tuple[list[ModelT], int]:
+        """List records with a total worked out according to `count_mode`.
+
+        Returns:
+            The records and the total. With `CountMode.NONE` the total is only a lower bound:
+            it is larger than ``offset + len(records)`` when there is a next page.
+        """
+        if count_mode is CountMode.EXACT:
+            return await self.list_and_count(limit_offset)
+        if count_mode is CountMode.NONE:
+            results = await self.list(LimitOffset(limit_offset.limit + 1, limit_offset.offset))
+            return results[:limit_offset.limit], limit_offset.offset + len(results)
+        results = await self.list(limit_offset)
+        # statistics can be stale, never report fewer rows than we have just seen
+        return results, max(await self.estimate_count(), limit_offset.offset + len(results))
+
+    async def insert_many(self, rows: Iterable[dict[str, Any]], *returning: Any) -> list[Row[Any]]:
+        """Insert `rows` with one ``INSERT ... RETURNING`` executemany per chunk.
+
+        Unlike `add_many()` no ORM objects are built, flushed or kept in the identity map, and
+        `rows` is consumed lazily, so only one chunk of parameters is held in memory at a time.
+
+        Args:
+            rows: Column values of the rows to insert, column defaults are applied as usual.
+            *returning: Columns to return for every inserted row, nothing is returned when empty.
+
+        Returns:
+            The `returning` columns of the inserted rows, in insert order.
+        """
+        statement = insert(self.model_type.__table__)
+        if returning:
+            statement = statement.returning(*returning, sort_by_parameter_order=True)
+        inserted: list[Row[Any]] = []
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.insert_chunk_size)):
+            result = await self.session.execute(statement, chunk)
+            if returning:
+                inserted.extend(result.all())
+        return inserted
+
+    async def update_values(self, item_id: Any, values: dict[str, Any]) -> ModelT:
+        """Update the record with one ``UPDATE ... WHERE id = ? RETURNING`` setting only `values`.
+
+        Unlike `update()` the record is not selected and merged first, nor refreshed after.
+        `updated_at`, when the model has one, is set here as the audit listener only runs on flush.
+        With no `values` the record is selected as it is, SQLite rejects an ``UPDATE`` without ``SET``.
+
+        Raises:
+            NotFoundException: No record has the id `item_id`, answered with a 404.
+        """
+        where = getattr(self.model_type, self.id_attribute) == item_id
+        if not values:
+            statement = select(self.model_type).where(where)
+        else:
+            if hasattr(self.model_type, "updated_at"):
+                values = {**values, "updated_at": datetime.now(timezone.utc)}
+            statement = update(self.model_type).where(where).values(**values).returning(self.model_type)
+        obj = (await self.session.execute(statement)).scalar_one_or_none()
+        if obj is None:
+            raise NotFoundException(detail=f"No {self.model_type.__tablename__} with id {item_id}")
+        return obj
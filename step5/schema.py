@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from advanced_alchemy.base import UUIDBase
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, delete, inspect, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+if TYPE_CHECKING:
+    from sqlalchemy import Connection
+
+SCHEMA_VERSION = 1
+"""Bump for changes `metadata_hash()` cannot see, e.g. a data migration."""
+
+# kept out of UUIDBase.metadata, it is not part of the schema it describes
+schema_version_table = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, nullable=False),
+    Column("metadata_hash", String(32), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def ensure_indexes(connection: Connection) -> list[str]:
+    """Create the declared indexes missing from the database, return their names.
+
+    `create_all` skips tables that already exist together with their indexes, so indexes
+    added to a model after its table was created have to be created here.
+    """
+    created = []
+    inspector = inspect(connection)
+    for table in UUIDBase.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                created.append(index.name)
+    return created
+
+
+def metadata_hash(connection: Connection) -> str:
+    """Hash the DDL of every table and index of the models, as compiled for `connection`."""
+    digest = hashlib.blake2b(digest_size=16)
+    for table in UUIDBase.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=connection.dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            digest.update(str(CreateIndex(index).compile(dialect=connection.dialect)).encode())
+    return digest.hexdigest()
+
+
+def schema_is_current(connection: Connection) -> bool:
+    """Whether the database was last migrated with this `SCHEMA_VERSION` and these models.
+
+    A single query, no reflection, so it is cheap enough for every startup.
+    """
+    try:
+        stored = connection.execute(
+            select(schema_version_table.c.version, schema_version_table.c.metadata_hash)).first()
+    except OperationalError:  # the table only exists once `migrate_schema` has run
+        return False
+    return stored is not None and tuple(stored) == (SCHEMA_VERSION, metadata_hash(connection))
+
+
+def migrate_schema(connection: Connection) -> None:
+    """Create the missing tables and indexes and record the version and hash they match."""
+    UUIDBase.metadata.create_all(connection)
+    ensure_indexes(connection)
+    schema_version_table.create(connection, checkfirst=True)
+    connection.execute(delete(schema_version_table))
+    connection.execute(insert(schema_version_table).values(
+        version=SCHEMA_VERSION,
+        metadata_hash=metadata_hash(connection),
+        applied_at=datetime.now(timezone.utc),
+    ))
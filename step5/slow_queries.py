@@ -0,0 +1,128 @@
+"""Log of the statements slower than a threshold, with their SQLite query plan.
+
+`SlowQueryLog.observe` is given every statement of the engines `step5.statements.instrument`
+times, with its duration. One slower than `threshold` seconds is kept with its SQL, the shape
+of its parameters (their types, never their values), its duration and the route that sent it,
+taken from `step5.metrics.current_route`. Its ``EXPLAIN QUERY PLAN`` is then read by a task of
+its own on `explain_engine`, the read-only one in the app, so the request does not wait for it
+and the writer connection is not held. The last `max_entries` are served by ``GET /admin/slow-queries``.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+from collections import deque
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import TYPE_CHECKING, Any
+
+from step5.common import BaseStruct
+from step5.metrics import current_route
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Connection
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+SLOW_QUERY_ENV_VAR = "SLOW_QUERY_MS"
+DEFAULT_THRESHOLD = 0.02
+"""Seconds a statement may take before it is logged."""
+DEFAULT_MAX_ENTRIES = 200
+EXPLAIN = "EXPLAIN QUERY PLAN "
+EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+
+class SlowQuery(BaseStruct):
+    """A statement slower than the threshold of the log."""
+
+    at: datetime
+    duration_ms: float
+    route: str | None
+    """Method and path template of the request, None outside requests."""
+    sql: str
+    parameters: str
+    """The types of the parameters, e.g. ``(str, int*10)``, ``3 rows of (str, str)`` for executemany."""
+    plan: list[str] | None = None
+    """The ``EXPLAIN QUERY PLAN`` detail lines, once read, SQLite only."""
+
+
+def parameter_shape(parameters: Any, executemany: bool = False) -> str:
+    """Describe `parameters` by their types, runs of one type counted rather than repeated."""
+    if executemany:
+        rows = list(parameters)
+        return f"{len(rows)} rows of {parameter_shape(rows[0]) if rows else '()'}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    types = [type(value).__name__ for value in parameters or ()]
+    runs = [(name, len(list(group))) for name, group in groupby(types)]
+    return "(" + ", ".join(name if count == 1 else f"{name}*{count}" for name, count in runs) + ")"
+
+
+class SlowQueryLog:
+    """The last `max_entries` statements slower than `threshold` seconds."""
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        explain_engine: AsyncEngine | None = None,
+    ) -> None:
+        self.threshold = threshold
+        self.entries: deque[SlowQuery] = deque(maxlen=max_entries)
+        self.explain_engine = explain_engine
+        """Engine the plans are read on, no plan is read without one."""
+        # plans by SQL, a slow statement tends to be slow every time
+        self._plans: dict[str, list[str]] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def observe(self, conn: Connection, statement: str, parameters: Any, executemany: bool, duration: float) -> None:
+        """`step5.statements.StatementObserver` logging the statements slower than `threshold`."""
+        if duration >= self.threshold and not statement.startswith(EXPLAIN):
+            self.record(conn, statement, parameters, executemany, duration)
+
+    def record(self, conn: Connection, statement: str, parameters: Any, executemany: bool, duration: float) -> None:
+        entry = SlowQuery(
+            at=datetime.now(timezone.utc),
+            duration_ms=round(duration * 1000, 3),
+            route=current_route.get(),
+            sql=" ".join(statement.split()),
+            parameters=parameter_shape(parameters, executemany),
+        )
+        self.entries.append(entry)
+        if self.explain_engine is None or conn.dialect.name != "sqlite":
+            return
+        if not statement.lstrip().upper().startswith(EXPLAINED):
+            return
+        if (plan := self._plans.get(statement)) is not None:
+            entry.plan = plan
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # a synchronous engine, no loop to read the plan later on
+            return
+        explained = list(parameters)[0] if executemany else parameters
+        # in a context of its own, the EXPLAIN is not one of the statements of the request
+        task = loop.create_task(self._explain(entry, statement, explained), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, entry: SlowQuery, statement: str, parameters: Any) -> None:
+        assert self.explain_engine is not None
+        try:
+            async with self.explain_engine.connect() as conn:
+                result = await conn.exec_driver_sql(EXPLAIN + statement, parameters)
+                plan = [row[3] for row in result]
+        except Exception as exc:  # the plan is a nice to have, never fail because of it
+            entry.plan = [f"EXPLAIN QUERY PLAN failed: {exc}"]
+            return
+        if len(self._plans) >= self.entries.maxlen:  # type: ignore[operator]
+            self._plans.clear()
+        entry.plan = self._plans[statement] = plan
+
+    async def wait(self) -> None:
+        """Wait for the plans being read."""
+        await asyncio.gather(*self._tasks)
+
+    def recent(self, limit: int | None = None) -> list[SlowQuery]:
+        """The logged statements, the most recent first."""
+        entries = list(reversed(self.entries))
+        return entries if limit is None else entries[:limit]
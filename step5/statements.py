@@ -0,0 +1,85 @@
+"""The statements each request sends, counted and timed once for everything reading them.
+
+`instrument` adds a single ``before/after_cursor_execute`` pair to an engine. Within a request
+each statement is added to the `RequestStatements` of `current()`, which the middleware reading
+them, the metrics, the query budgets and Server-Timing, share through `track()`. Every
+statement, in a request or not, is also handed with its duration to the observers of the
+engine, like `step5.slow_queries.SlowQueryLog.observe`.
+"""
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+from contextvars import ContextVar, Token
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import event
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Connection
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+StatementObserver = Callable[["Connection", str, Any, bool, float], None]
+"""Called after each statement with its connection, SQL, parameters, executemany flag and seconds."""
+
+
+class RequestStatements:
+    """The statements sent by a request, and the seconds they took."""
+
+    __slots__ = ("count", "seconds", "sent")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        self.sent: dict[str, int] = {}
+        """Times each SQL string was sent."""
+
+
+_current: ContextVar[RequestStatements | None] = ContextVar("request_statements", default=None)
+
+
+def current() -> RequestStatements | None:
+    """The statements of the request being handled, None outside requests."""
+    return _current.get()
+
+
+def track() -> tuple[RequestStatements, Token[RequestStatements | None] | None]:
+    """Track the statements of the request, or reuse those an outer middleware already tracks.
+
+    The token is given back to `untrack` once the request is done. Plain functions rather than
+    a context manager, which costs a few microseconds more per request.
+    """
+    if (statements := _current.get()) is not None:
+        return statements, None
+    statements = RequestStatements()
+    return statements, _current.set(statements)
+
+
+def untrack(token: Token[RequestStatements | None] | None) -> None:
+    if token is not None:
+        _current.reset(token)
+
+
+def instrument(engine: AsyncEngine, *observers: StatementObserver) -> None:
+    """Count and time the statements `engine` sends for the request running them, and pass them to `observers`.
+
+    Call it once per engine.
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn: Connection, cursor: Any, statement: str, *args: Any) -> None:
+        # counted before they run, a failing statement is a round trip too
+        if (statements := _current.get()) is not None:
+            statements.count += 1
+            statements.sent[statement] = statements.sent.get(statement, 0) + 1
+        conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(
+        conn: Connection, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool,
+    ) -> None:
+        duration = time.perf_counter() - conn.info["statement_start"].pop()
+        if (statements := _current.get()) is not None:
+            statements.seconds += duration
+        for observer in observers:
+            observer(conn, statement, parameters, executemany, duration)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path, PurePosixPath
+
+from litestar import Request, Response, route
+from litestar.enums import HttpMethod
+from litestar.exceptions import NotFoundException
+from litestar.handlers import HTTPRouteHandler
+
+from step5.compression import SKIP_COMPRESSION_OPT_KEY, compress, pick_encoding
+from step5.conditional import Validator, check_not_modified
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+# assets are compressed once, so the slowest, smallest settings are affordable
+PRECOMPRESSION = (("br", 11), ("gzip", 9))
+
+
+@dataclass
+class StaticAsset:
+    """A file read into memory, with its precompressed variants."""
+
+    name: str
+    """Path relative to the directory, with ``/`` separators."""
+    hashed_name: str
+    """`name` with the content hash before the suffix, e.g. ``favicon.1a2b3c4d5e6f7a8b.ico``."""
+    media_type: str
+    validator: Validator
+    bodies: dict[str | None, bytes] = field(default_factory=dict)
+    """Body by content encoding, ``None`` is the identity. Variants that are not smaller are left out."""
+
+
+def load_asset(name: str, body: bytes, media_type: str, last_modified: datetime | None = None) -> StaticAsset:
+    """Build the asset of `body` with its content hashed name, strong ETag and compressed variants."""
+    digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+    path = PurePosixPath(name)
+    asset = StaticAsset(
+        name=name,
+        hashed_name=str(path.with_name(f"{path.stem}.{digest}{path.suffix}")),
+        media_type=media_type,
+        validator=Validator(etag=f'"{digest}"', last_modified=last_modified),
+        bodies={None: body},
+    )
+    for encoding, level in PRECOMPRESSION:
+        compressed = compress(body, encoding, level)
+        if len(compressed) < len(body):
+            asset.bodies[encoding] = compressed
+    return asset
+
+
+def asset_response(request: Request, asset: StaticAsset, cache_control: str) -> Response[bytes]:
+    """Answer with a 304 when the client's copy is current, else with the best variant it accepts."""
+    headers = {"cache-control": cache_control, "vary": "Accept-Encoding"}
+    check_not_modified(request, asset.validator, headers)
+    encoding = pick_encoding(request.headers.get("accept-encoding", ""), [e for e in asset.bodies if e])
+    if encoding is not None:
+        headers["content-encoding"] = encoding
+    return Response(content=asset.bodies[encoding], media_type=asset.media_type, headers=headers)
+
+
+class StaticAssets:
+    """Static files served from memory under content hashed URLs.
+
+    Every file of `directory` is read and compressed with Brotli and gzip once, when the app is
+    built. A file is served at its hashed URL (see `url_for()`) with an immutable `Cache-Control`,
+    and at its plain URL for clients that do not know the hash, revalidated with its ETag.
+    """
+
+    def __init__(self, path: str, directory: str | Path) -> None:
+        self.path = "/" + path.strip("/")
+        self.directory = Path(directory)
+        self._assets: dict[str, StaticAsset] = {}
+        self._hashed: dict[str, StaticAsset] = {}
+        for file in sorted(self.directory.rglob("*")):
+            if file.is_file():
+                asset = self._load(file)
+                self._assets[asset.name] = asset
+                self._hashed[asset.hashed_name] = asset
+
+    def _load(self, file: Path) -> StaticAsset:
+        name = PurePosixPath(file.relative_to(self.directory).as_posix())
+        return load_asset(
+            str(name),
+            file.read_bytes(),
+            mimetypes.guess_type(name.name)[0] or "application/octet-stream",
+            datetime.fromtimestamp(file.stat().st_mtime, tz=timezone.utc),
+        )
+
+    def url_for(self, name: str) -> str:
+        """Get the content hashed URL of the file `name`, its plain URL when there is no such file."""
+        asset = self._assets.get(name)
+        return f"{self.path}/{asset.hashed_name if asset is not None else name}"
+
+    def response(self, request: Request, file_path: str) -> Response[bytes]:
+        file_path = file_path.lstrip("/")
+        if (asset := self._hashed.get(file_path)) is not None:
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        elif (asset := self._assets.get(file_path)) is not None:
+            cache_control = REVALIDATE_CACHE_CONTROL
+        else:
+            raise NotFoundException()
+        return asset_response(request, asset, cache_control)
+
+    def route_handler(self) -> HTTPRouteHandler:
+        """Build the GET and HEAD handler of the files, to add to the app's route handlers."""
+
+        @route(
+            path=f"{self.path}/{{file_path:path}}",
+            http_method=[HttpMethod.GET, HttpMethod.HEAD],
+            include_in_schema=False,
+            opt={SKIP_COMPRESSION_OPT_KEY: True},
+            sync_to_thread=False,
+        )
+        def get_static_file(request: Request, file_path: str) -> Response[bytes]:
+            return self.response(request, file_path)
+
+        return get_static_file
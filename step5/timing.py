@@ -0,0 +1,153 @@
+"""``Server-Timing`` response headers, the time of a request split by phase.
+
+`ServerTimingMiddleware` gives each request a list of counters in a context variable, the
+phases add the `time.perf_counter` difference they measure to theirs:
+
+- ``deps``, the dependency providers, through `TimedProvide`
+- ``db``, statements on the cursor, read from `step5.statements` which times them for the request
+- ``orm``, building ORM objects from the rows, the time of each ORM execution minus its ``db``
+- ``validate``, Pydantic request bodies, through `TimedPydanticInitPlugin`, and the conversions
+  to response schemas (`step5.common.from_orm`)
+- ``encode``, rendering the response body to JSON, through `TimedResponse`
+- ``compress``, `step5.compression.CompressionMiddleware`
+
+The header is added when the response starts, so statements sent while a body streams are
+not in it. Outside of a request every hook is a context variable lookup.
+"""
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any
+
+from litestar import Response
+from litestar.contrib.pydantic import PydanticInitPlugin
+from litestar.datastructures import MutableScopeHeaders
+from litestar.di import Provide
+from litestar.enums import ScopeType
+from litestar.middleware import AbstractMiddleware
+from litestar.serialization import default_serializer
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from step5.statements import current, track, untrack
+
+if TYPE_CHECKING:
+    from litestar.types import Message, Receive, Scope, Send, Serializer
+    from sqlalchemy.orm import ORMExecuteState
+
+SERVER_TIMING_ENV_VAR = "SERVER_TIMING"
+DEPS, DB, ORM, VALIDATE, ENCODE, COMPRESS = range(6)
+PHASES = (
+    ("deps", "Dependency resolution"),
+    ("db", "DB execution"),
+    ("orm", "ORM materialization"),
+    ("validate", "Validation"),
+    ("encode", "JSON encoding"),
+    ("compress", "Compression"),
+)
+
+# seconds spent in each phase by the current request, indexed by phase, None outside requests
+_timings: ContextVar[list[float] | None] = ContextVar("timings", default=None)
+
+
+def add(phase: int, start: float) -> None:
+    """Count the time since `start`, a `time.perf_counter` value, toward `phase` of the current request."""
+    if (timings := _timings.get()) is not None:
+        timings[phase] += time.perf_counter() - start
+
+
+def _time_orm_execute(orm_execute_state: ORMExecuteState) -> Any:
+    # the async session buffers ORM results, the objects are built before `invoke_statement` returns
+    if (timings := _timings.get()) is None or (statements := current()) is None:
+        return None
+    db = statements.seconds
+    start = time.perf_counter()
+    result = orm_execute_state.invoke_statement()
+    timings[ORM] += time.perf_counter() - start - (statements.seconds - db)
+    return result
+
+
+def instrument() -> None:
+    """Time the ORM executions of every session for the request running them."""
+    if not event.contains(Session, "do_orm_execute", _time_orm_execute):
+        event.listen(Session, "do_orm_execute", _time_orm_execute)
+
+
+class TimedProvide(Provide):
+    """A `Provide` counting the time of its dependency toward ``deps``."""
+
+    async def __call__(self, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return await super().__call__(**kwargs)
+        finally:
+            add(DEPS, start)
+
+
+def _timed_decoder(decoder: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    def decode(target_type: Any, value: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return decoder(target_type, value)
+        finally:
+            add(VALIDATE, start)
+
+    return decode
+
+
+class TimedPydanticInitPlugin(PydanticInitPlugin):
+    """A `PydanticInitPlugin` counting the validation of Pydantic request bodies toward ``validate``.
+
+    Litestar then adds the `PydanticSchemaPlugin` itself, as it does with its default `PydanticPlugin`.
+    """
+
+    @classmethod
+    def decoders(cls) -> list[tuple[Callable[[Any], bool], Callable[[Any, Any], Any]]]:
+        return [(predicate, _timed_decoder(decoder)) for predicate, decoder in super().decoders()]
+
+
+class TimedResponse(Response):
+    """A `Response` counting the rendering of its body toward ``encode``."""
+
+    def render(self, content: Any, media_type: str, enc_hook: Serializer = default_serializer) -> bytes:
+        start = time.perf_counter()
+        try:
+            return super().render(content, media_type, enc_hook)
+        finally:
+            add(ENCODE, start)
+
+
+def header_value(timings: list[float], total: float) -> str:
+    metrics = [f'{name};dur={seconds * 1000:.3f};desc="{description}"'
+               for (name, description), seconds in zip(PHASES, timings)]
+    return ", ".join([*metrics, f"total;dur={total * 1000:.3f}"])
+
+
+class ServerTimingMiddleware(AbstractMiddleware):
+    """Add a ``Server-Timing`` header with the time of each phase, and the total, to the responses.
+
+    Has to come before `CompressionMiddleware`, to see the time it takes.
+    """
+
+    scopes = {ScopeType.HTTP}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        timings = [0.0] * len(PHASES)
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                timings[DB] = statements.seconds
+                value = header_value(timings, time.perf_counter() - start)
+                MutableScopeHeaders.from_message(message).add("server-timing", value)
+            await send(message)
+
+        statements, statements_token = track()
+        token = _timings.set(timings)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timings.reset(token)
+            untrack(statements_token)